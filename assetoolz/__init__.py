@@ -1,15 +1,18 @@
 from __future__ import absolute_import
 import argparse
 import os
-from .detour import detour_directory
-from .cache import Cache
+import sys
+from .detour import scan_directories
+from .cache import Cache, ParseCache, PartialCache
 from .db import entry_point
 from .appconf import AppConfHelper
-from .assets import AssetCollection
+from .assets import AssetCollection, get_supported_extensions
 import yaml
-from .utils import load_file
+from .utils import load_file, FileHashes
 from .i18n import I18nHelper
 from .resource import ResourceSet
+from .watch import Watcher
+from .profiler import Profiler
 
 
 class AssetSettings:
@@ -35,8 +38,30 @@ class LocalizedAssetSettings(AssetSettings):
         return self._data['languages']
 
 
+class PrecompressSettings(object):
+    def __init__(self, data):
+        self._data = data
+
+    @property
+    def gzip_level(self):
+        return self._data.get('gzip_level', 9)
+
+    @property
+    def brotli_quality(self):
+        return self._data.get('brotli_quality', 11)
+
+    @property
+    def min_size(self):
+        return self._data.get('min_size', 1024)
+
+    @property
+    def extensions(self):
+        return self._data.get('extensions', [
+            '.css', '.js', '.html', '.svg', '.eot', '.ttf'])
+
+
 class Settings:
-    def __init__(self, conf_file, verbose, force):
+    def __init__(self, conf_file, verbose, force, jobs=1):
         self._data = yaml.load(load_file(conf_file))
         self._html = LocalizedAssetSettings(self._data['html'])
         self._images = AssetSettings(self._data['images'])
@@ -46,9 +71,14 @@ class Settings:
 
         self._i18n_helper = I18nHelper(self._data['i18n'])
         self._resources = ResourceSet(self._data['resource'])
+        if self._data.get('precompress') is not None:
+            self._precompress = PrecompressSettings(self._data['precompress'])
+        else:
+            self._precompress = None
 
         self._verbose = verbose
         self._force = force
+        self._jobs = jobs
 
     @property
     def verbose(self):
@@ -66,10 +96,63 @@ class Settings:
     def force(self):
         return self._force
 
+    @property
+    def jobs(self):
+        return self._jobs
+
     @property
     def minify(self):
         return self._data['minify']
 
+    @property
+    def change_detection(self):
+        return self._data.get('change_detection', 'mtime')
+
+    @property
+    def fingerprint(self):
+        return self._data.get('fingerprint', 'random')
+
+    @property
+    def checksum_algorithm(self):
+        return self._data.get('checksum_algorithm', 'sha256')
+
+    @property
+    def binary_copy(self):
+        # 'copy', 'fast' - reflink, then an in-kernel copy with
+        # copy_file_range (Python 3.8+) or sendfile (os.sendfile on Python
+        # 3.3+, libc on linux otherwise), 'hardlink' - a hard link first
+        return self._data.get('binary_copy', 'copy')
+
+    @property
+    def minify_backend(self):
+        return self._data.get('minify_backend', 'process')
+
+    @property
+    def minify_batch_size(self):
+        return self._data.get('minify_batch_size', 200)
+
+    @property
+    def parse_cache(self):
+        # reuse dependencies of unchanged sources from the previous run
+        return self._data.get('parse_cache', True)
+
+    @property
+    def lazy_load(self):
+        # keep source text in memory only while an asset is parsed or built,
+        # localized variants are parsed from one read but every variant that
+        # is built reads its source again
+        return self._data.get('lazy_load', False)
+
+    @property
+    def tool_io(self):
+        # 'file' - exchange data with external tools through temporary
+        # files, 'pipe' - through their stdin and stdout
+        return self._data.get('tool_io', 'file')
+
+    @property
+    def coffee_backend(self):
+        return self._data.get('coffee_backend', 'process')
+
     @property
     def yuicompressor_file(self):
         return self._data['yuicompressor_file']
@@ -94,6 +177,37 @@ class Settings:
     def cache_path(self):
         return self._data['cache']
 
+    @property
+    def cache_backend(self):
+        # 'orm' - SQLAlchemy models, 'sqlite' - plain sqlite3 with bulk
+        # reads and writes, both use the same cache.db
+        return self._data.get('cache_backend', 'orm')
+
+    @property
+    def cache_batch_size(self):
+        return self._data.get('cache_batch_size', 1)
+
+    @property
+    def precompress(self):
+        return self._precompress
+
+    @property
+    def ignore(self):
+        return self._data.get('ignore', ['.git', '.hg', '.svn'])
+
+    @property
+    def watch_interval(self):
+        return self._data.get('watch_interval', 0.5)
+
+    @property
+    def manifest(self):
+        return self._data.get('manifest')
+
+    @property
+    def partial_cache_size(self):
+        # megabytes of compiled partials kept in memory, 0 disables
+        return self._data.get('partial_cache_size', 32)
+
     @property
     def partials(self):
         return os.path.join(self.cache_path, "partials")
@@ -118,6 +232,16 @@ class Settings:
     def stylesheets(self):
         return self._stylesheets
 
+    @property
+    def source_dirs(self):
+        return [
+            self.html.source,
+            self.scripts.source,
+            self.stylesheets.source,
+            self.images.source,
+            self.fonts.source
+        ]
+
     @property
     def i18n_helper(self):
         return self._i18n_helper
@@ -127,38 +251,113 @@ class Settings:
         return self._resources
 
 
-@entry_point
-def compile(settings):
-    file_list = []
-    update_file_list = lambda x: file_list.append(x)
+def scan_sources(settings):
+    return scan_directories(settings.source_dirs,
+                            get_supported_extensions(), settings.ignore,
+                            settings.jobs)
+
 
-    detour_directory(settings.html.source, update_file_list)
-    detour_directory(settings.scripts.source, update_file_list)
-    detour_directory(settings.stylesheets.source, update_file_list)
-    detour_directory(settings.images.source, update_file_list)
-    detour_directory(settings.fonts.source, update_file_list)
+def load_assets(settings):
+    profiler = Profiler()
+    with profiler.measure('scan'):
+        files = scan_sources(settings)
+    file_list = [path for path, stat in files]
+
+    file_hashes = FileHashes()
+    file_hashes.clear()
+    file_hashes.set_algorithm(settings.checksum_algorithm)
 
     tool_cache = Cache()
-    tool_cache.check()
+    tool_cache.set_batch_size(settings.cache_batch_size)
+    with profiler.measure('cache.check'):
+        tool_cache.check()
+        ParseCache().check()
+    PartialCache().set_max_size(settings.partial_cache_size * 1024 * 1024)
+
+    with profiler.measure('collect'):
+        assets = AssetCollection(file_list, settings, dict(files))
+    with profiler.measure('pick_dependencies'):
+        assets.pick_dependencies()
+    return assets
 
-    assets = AssetCollection(file_list, settings)
-    assets.pick_dependencies()
+
+@entry_point
+def compile(settings):
+    assets = load_assets(settings)
     assets.build()
 
 
+@entry_point
+def affected(settings, paths):
+    # only the asset list goes to stdout so that scripts can read it,
+    # progress and warnings are printed to stderr
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        assets = load_assets(settings)
+        affected_assets = assets.get_affected_by(paths)
+    finally:
+        sys.stdout = stdout
+    for asset in affected_assets:
+        print('{path}\t{lang}'.format(path=asset._path,
+                                      lang=asset._lang or ''))
+
+
+@entry_point
+def rebuild(settings, paths):
+    assets = load_assets(settings)
+    assets.rebuild(paths, force=True)
+
+
+@entry_point
+def watch(settings):
+    watcher = Watcher(settings, scan_sources, load_assets)
+    watcher.run()
+
+
 def main():
     parser = argparse.ArgumentParser(description="assetoolz")
     parser.add_argument('config', metavar='config', type=str)
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-f', '--force', action='store_true')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('-w', '--watch', action='store_true')
+    parser.add_argument('--affected', nargs='+', metavar='PATH',
+                        help='list assets affected by the given sources')
+    parser.add_argument('--rebuild', nargs='+', metavar='PATH',
+                        help='rebuild the given sources and everything '
+                             'that depends on them')
+    parser.add_argument('-p', '--profile', action='store_true')
+    parser.add_argument('--profile-top', type=int, default=10)
+    parser.add_argument('--profile-output', type=str, default=None)
+    parser.add_argument('--profile-format', choices=['json', 'trace'],
+                        default='json')
     args = parser.parse_args()
 
     config = args.config
     verbose = args.verbose
     force = args.force
-    settings = Settings(config, verbose, force)
+    jobs = max(args.jobs, 1)
+    settings = Settings(config, verbose, force, jobs)
     AppConfHelper().initialize(settings.appconf)
-    compile(settings)
+    profiler = Profiler()
+    if args.profile or args.profile_output is not None:
+        profiler.enable()
+    try:
+        with profiler.measure('total'):
+            if args.watch:
+                watch(settings)
+            elif args.affected is not None:
+                affected(settings, args.affected)
+            elif args.rebuild is not None:
+                rebuild(settings, args.rebuild)
+            else:
+                compile(settings)
+    finally:
+        if args.profile:
+            profiler.report(args.profile_top)
+        if args.profile_output is not None:
+            profiler.save(args.profile_output, args.profile_format)
 
 
 if __name__ == '__main__':
@@ -1,19 +1,33 @@
 import os
-from .cache import Cache
-from .models import CacheEntry
-from .utils import get_file_hash, save_file, load_file
-import shutil
+from .cache import Cache, ParseCache, PartialCache
+from .utils import get_file_hash, get_data_hash, shorten_digest, save_file,\
+    make_dirs, FileHashes
+from .filecopy import copy_file, get_temp_path
+from hashlib import sha256
 import io
-from .compiler import ExpressionProcessor
+import threading
+from collections import OrderedDict
+from .compiler import ExpressionProcessor, find_matches, find_matches_at,\
+    get_parser_key
+from .scheduler import BuildScheduler
+from .minify import get_minifier
+from .coffee import get_coffee_compiler
+from .manifest import Manifest
+from .compress import Precompressor, remove_variants
+from .profiler import Profiler
 from .expressions import stylesheets, scripts, html
-import subprocess
-import tempfile
 
 
 class AssetCollection(object):
-    def __init__(self, file_list, settings):
+    def __init__(self, file_list, settings, stats=None):
         self._assets = []
+        self._levels = []
+        self._dependents = {}
+        # (path, lang) pairs that could not be resolved, by path
+        self._unresolved = OrderedDict()
         self._settings = settings
+        self._minifier = get_minifier(settings)
+        self._coffee = get_coffee_compiler(settings)
         for path in file_list:
             res = get_asset_objects(path, settings)
             if type(res) is list:
@@ -27,56 +41,294 @@ class AssetCollection(object):
                 self._assets.append(res)
                 self._assets[-1]._collection = self
                 self._assets[-1]._settings = settings
+        if stats is not None:
+            for asset in self._assets:
+                asset._stat = stats.get(asset._path)
+        self._registry = dict((AssetCollection._get_key(asset._path,
+                                                        asset._lang), asset)
+                              for asset in self._assets)
+
+    @property
+    def minifier(self):
+        return self._minifier
+
+    @property
+    def coffee(self):
+        return self._coffee
+
+    @staticmethod
+    def _get_key(path, lang):
+        return os.path.normpath(path), lang
 
     def find_asset(self, path, lang):
-        for asset in self._assets:
-            if asset._path == path and asset._lang == lang:
-                return asset
-        return None
+        return self._registry.get(AssetCollection._get_key(path, lang))
+
+    def add_unresolved(self, asset, path):
+        self._unresolved.setdefault(path, []).append(asset)
+
+    def report_unresolved(self):
+        if len(self._unresolved) == 0:
+            return
+        print("Couldn't find {count:d} dependencies:".format(
+            count=len(self._unresolved)))
+        for path, assets in self._unresolved.items():
+            print('  {path} (required by {assets})'.format(
+                path=path, assets=', '.join(repr(asset) for asset in assets)))
+        self._unresolved.clear()
 
     def pick_dependencies(self):
         print('Found {count:d} assets'.format(count=len(self._assets)))
 
         if self._settings.verbose:
             print("Picking dependencies...")
-        for asset in self._assets:
-            asset.parse()
-            if self._settings.verbose:
+        profiler = Profiler()
+        self._parse_assets(self._assets)
+        if self._settings.verbose:
+            for asset in self._assets:
                 print(asset)
                 print('Dependencies {dependencies}\n'.format(
-                      dependencies=asset._dependencies))
+                      dependencies=sorted(asset._dependencies, key=repr)))
 
-        self._assets = DependencyResolver.topological_sort(self._assets)
+        ParseCache().flush()
+        self.report_unresolved()
+
+        with profiler.measure('resolve'):
+            self._levels = DependencyResolver.get_levels(self._assets)
+            self._index_dependents()
+        self._assets = [asset for level in self._levels for asset in level]
         if self._settings.verbose:
             print('Build order:\n{collection}\n'.format(
                   collection=self._assets))
 
-    def build(self):
-        print('Building assets...')
+    def _parse_assets(self, assets):
+        # with lazy_load the localized variants of a source are released
+        # together after the last of them is parsed, so the shared text is
+        # read and scanned only once
+        variants = {}
+        for asset in assets:
+            variants.setdefault(asset._path, []).append(asset)
+        parsed = {}
+        profiler = Profiler()
+        for asset in assets:
+            with profiler.measure('parse', asset):
+                asset.parse()
+            parsed[asset._path] = parsed.get(asset._path, 0) + 1
+            if self._settings.lazy_load and\
+                    parsed[asset._path] == len(variants[asset._path]):
+                for variant in variants[asset._path]:
+                    variant.release()
+
+    def _index_dependents(self):
+        # reverse dependency index, (path, lang) -> assets that use it
+        self._dependents = {}
+        for asset in self._assets:
+            self._add_dependents(asset)
+
+    def _add_dependents(self, asset):
+        for dependency in asset._dependencies:
+            self._dependents.setdefault(
+                (dependency._path, dependency._lang), set()).add(asset)
+
+    def _remove_dependents(self, asset, dependencies):
+        for dependency in dependencies:
+            self._dependents.get(
+                (dependency._path, dependency._lang), set()).discard(asset)
+
+    def get_dependents(self, asset):
+        return list(self._dependents.get((asset._path, asset._lang), ()))
+
+    def find_sources(self, paths):
+        paths = set(os.path.abspath(path) for path in paths)
+        return [asset for asset in self._assets
+                if os.path.abspath(asset._path) in paths]
+
+    def get_affected(self, assets):
+        # the given assets and everything that transitively depends on
+        # them, in build order
+        affected = set()
+        stack = [(asset._path, asset._lang) for asset in assets]
+        while len(stack) > 0:
+            key = stack.pop()
+            if key in affected:
+                continue
+            affected.add(key)
+            for dependent in self._dependents.get(key, ()):
+                stack.append((dependent._path, dependent._lang))
+        return [asset for asset in self._assets
+                if (asset._path, asset._lang) in affected]
+
+    def get_affected_by(self, paths):
+        return self.get_affected(self.find_sources(paths))
+
+    def rebuild(self, paths, force=False):
+        # parses the given sources again and builds them together with
+        # everything depending on them, force builds the whole set even
+        # if the change detection finds nothing to do
+        changed = self.find_sources(paths)
+        dependencies = {}
+        for asset in changed:
+            dependencies[asset] = asset._dependencies
+            asset._stat = None
+        self._parse_assets(changed)
+        for asset in changed:
+            self._remove_dependents(asset, dependencies[asset])
+            self._add_dependents(asset)
+        ParseCache().flush()
+        self.report_unresolved()
+        self._levels = DependencyResolver.get_levels(self._assets)
+        self._assets = [asset for level in self._levels for asset in level]
+
         for asset in self._assets:
-            asset.compile(force=self._settings.force)
+            asset._flag_modified = False
+        affected = self.get_affected(changed)
+        self.build(affected, force=force)
+        return affected
+
+    def build(self, assets=None, force=None):
+        if assets is None:
+            assets = self._assets
+        if force is None:
+            force = self._settings.force
+        print('Building assets...')
+        profiler = Profiler()
+        try:
+            with profiler.measure('build'):
+                if self._coffee.batched:
+                    for group in self._split_groups(assets):
+                        self._coffee.prepare(group, force)
+                        self._build_assets(group, force)
+                else:
+                    self._build_assets(assets, force)
+                self._minifier.flush()
+        finally:
+            self._minifier.close()
+            Cache().flush()
+        if self._settings.precompress is not None:
+            with profiler.measure('precompress'):
+                self.precompress()
+        if self._settings.manifest is not None:
+            with profiler.measure('manifest'):
+                manifest = Manifest(self._settings.manifest)
+                if manifest.update(self._assets, self._settings):
+                    manifest.save()
+                    print('Updated manifest')
         print('Build done.')
+        self._minifier.report()
+
+    def _build_assets(self, assets, force):
+        if self._settings.jobs > 1:
+            scheduler = BuildScheduler(assets, self._settings.jobs,
+                                       force=force)
+            scheduler.run()
+        else:
+            for asset in assets:
+                asset.compile(force=force)
+
+    def _split_groups(self, assets):
+        # A new group starts at every level with CoffeeScript sources, so
+        # they are compiled together once everything they include is built.
+        level_of = {}
+        for index, level in enumerate(self._levels):
+            for asset in level:
+                level_of[(asset._path, asset._lang)] = index
+        buckets = {}
+        for asset in assets:
+            buckets.setdefault(level_of[(asset._path, asset._lang)],
+                               []).append(asset)
+
+        groups = []
+        for index in sorted(buckets):
+            bucket = buckets[index]
+            has_coffee = any(asset.is_coffee() for asset in bucket)
+            if len(groups) == 0 or has_coffee:
+                groups.append(bucket)
+            else:
+                groups[-1].extend(bucket)
+        return groups
+
+    def precompress(self):
+        tool_cache = Cache()
+        paths = []
+        for asset in self._assets:
+            cache_entry = tool_cache.find_entry(asset._path, asset._lang)
+            if cache_entry is None or asset.is_partial(cache_entry.target):
+                continue
+            paths.append(cache_entry.target)
+
+        precompressor = Precompressor(self._settings.precompress,
+                                      self._settings.jobs)
+        count = precompressor.run(paths, force=self._settings.force)
+        if count > 0:
+            print('Precompressed {count:d} files'.format(count=count))
 
 
 class DependencyResolver(object):
     @staticmethod
-    def topological_sort(assets_unsorted):
-        assets_sorted = []
+    def _sort_key(key):
+        return (key[0], key[1] or '')
 
-        while len(assets_unsorted) > 0:
-            acyclic = False
-            for asset in assets_unsorted:
-                for dependency in asset._dependencies:
-                    if dependency in assets_unsorted:
-                        break
-                else:
-                    acyclic = True
-                    assets_unsorted.remove(asset)
-                    assets_sorted.append(asset)
+    @staticmethod
+    def get_levels(assets):
+        # Kahn's algorithm, one level ("wave") at a time. Assets inside a
+        # level do not depend on each other, levels are sorted by path so
+        # the build order does not depend on directory listing order.
+        nodes = {}
+        for asset in assets:
+            nodes[(asset._path, asset._lang)] = asset
+
+        dependents = dict((key, []) for key in nodes)
+        pending = {}
+        for key, asset in nodes.items():
+            deps = set((dep._path, dep._lang) for dep in asset._dependencies)
+            deps.intersection_update(nodes)
+            pending[key] = len(deps)
+            for dep in deps:
+                dependents[dep].append(key)
+
+        levels = []
+        resolved = 0
+        wave = sorted([key for key, count in pending.items() if count == 0],
+                      key=DependencyResolver._sort_key)
+        while len(wave) > 0:
+            levels.append([nodes[key] for key in wave])
+            resolved += len(wave)
+            next_wave = []
+            for key in wave:
+                for dependent in dependents[key]:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        next_wave.append(dependent)
+            wave = sorted(next_wave, key=DependencyResolver._sort_key)
+
+        if resolved < len(nodes):
+            cycle = DependencyResolver._find_cycle(nodes, pending)
+            raise RuntimeError('A cyclic dependency occurred: {cycle}'.format(
+                cycle=' -> '.join([repr(nodes[key]) for key in cycle])))
+
+        return levels
 
-            if not acyclic:
-                raise RuntimeError('A cyclic dependency occurred')
+    @staticmethod
+    def _find_cycle(nodes, pending):
+        # every unresolved asset has at least one unresolved dependency,
+        # so following them must eventually come back to a visited asset
+        unresolved = set(key for key, count in pending.items() if count > 0)
+        key = min(unresolved, key=DependencyResolver._sort_key)
+        path = []
+        position = {}
+        while key not in position:
+            position[key] = len(path)
+            path.append(key)
+            deps = [(dep._path, dep._lang)
+                    for dep in nodes[key]._dependencies]
+            key = min([dep for dep in deps if dep in unresolved],
+                      key=DependencyResolver._sort_key)
+        return path[position[key]:] + [key]
 
+    @staticmethod
+    def topological_sort(assets_unsorted):
+        assets_sorted = []
+        for level in DependencyResolver.get_levels(assets_unsorted):
+            assets_sorted.extend(level)
         return assets_sorted
 
 
@@ -84,19 +336,29 @@ class Asset(object):
     FILE = 0
     STRING = 1
 
+    fingerprinted = False
+
     def __init__(self, resource_type, path, lang):
         self._resource_type = resource_type
         self._path = path
         self._lang = lang
         self._collection = None
         self._settings = None
-        self._dependencies = []
+        self._dependencies = set()
+        self._requested_dependencies = []
         self._tool_cache = Cache()
         self._flag_modified = False
+        self._checksum = None
+        # stat taken while scanning the source tree, if any
+        self._stat = None
+        self._track_dependencies = True
 
     def is_partial(self, path):
         return os.path.basename(path).startswith("_")
 
+    def is_coffee(self):
+        return False
+
     def get_target_path(self, **opts):
         common_prefix = os.path.commonprefix([
             self._path,
@@ -120,91 +382,324 @@ class Asset(object):
             target_path = os.path.join(self._get_target_dir(), path_part)
         return target_path
 
+    def get_source_name(self):
+        common_prefix = os.path.commonprefix([
+            self._path,
+            self._get_source_dir()])
+        return self._path[len(common_prefix) + 1:]
+
     def __repr__(self):
         if self._lang is None:
             t = '{path}'
         else:
             t = '{path} ({lang})'
-        common_prefix = os.path.commonprefix([
-            self._path,
-            self._get_source_dir()])
-        return t.format(path=self._path[len(common_prefix) + 1:],
-                        lang=self._lang)
+        return t.format(path=self.get_source_name(), lang=self._lang)
 
     def add_dependency(self, path, lang=None):
+        if not self._track_dependencies:
+            return
+        self._requested_dependencies.append((path, lang))
         dependency = self._collection.find_asset(path, lang)
-        if dependency:
-            if dependency not in self._dependencies:
-                self._dependencies.append(dependency)
+        if dependency is not None:
+            self._dependencies.add(dependency)
         else:
-            print("Couldn't find dependency with path %s" % path)
+            self._collection.add_unresolved(self, path)
 
     def __eq__(self, other):
         return self._path == other._path and self._lang == other._lang
 
     def __ne__(self, other):
-        return self._path != other._path and self._lang != other._lang
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self._path, self._lang))
 
     def parse(self):
+        self._dependencies = set()
+        self._requested_dependencies = []
         self._parse()
 
-    def dependencies_modified(self):
+    def release(self):
+        pass
+
+    def dependencies_modified(self, cache_entry=None):
         for dep_asset in self._dependencies:
             if dep_asset._flag_modified:
                 return True
+            # also catches dependencies rebuilt by an earlier run that
+            # stopped before this asset was built
+            if cache_entry is not None:
+                dep_entry = self._tool_cache.find_entry(dep_asset._path,
+                                                        dep_asset._lang)
+                if dep_entry is not None and\
+                        dep_entry.built_after(cache_entry):
+                    return True
         return False
 
-    def compile(self, force=False):
-        if self._resource_type == Asset.FILE:
-            cache_entry = self._tool_cache.find_entry(self._path, self._lang)
-
-            file_modified = True if cache_entry is None\
-                else cache_entry.file_modified() or self.dependencies_modified()
+    def source_modified(self, cache_entry):
+        if self._settings.change_detection != 'checksum':
+            return cache_entry.file_modified(self._stat)
+        if not os.path.exists(cache_entry.target):
+            return True
+        if not cache_entry.stat_modified(self._stat):
+            return False
+        if cache_entry.content_modified(self._stat):
+            return True
+        self._tool_cache.refresh(cache_entry)
+        return False
 
-            if file_modified or force:
-                if cache_entry:
-                    if os.path.exists(cache_entry.target):
-                        os.remove(cache_entry.target)
+    def is_outdated(self, force=False):
+        cache_entry = self._tool_cache.find_entry(self._path, self._lang)
+
+        file_modified = True if cache_entry is None\
+            else self.source_modified(cache_entry) or\
+            self.dependencies_modified(cache_entry)
+
+        return file_modified or force, cache_entry
+
+    def get_fingerprint(self):
+        if self._settings.fingerprint == 'content':
+            return self._get_content_hash()
+        return get_file_hash(self._path, unique=True)
+
+    def is_unchanged(self, cache_entry, target_path):
+        # a content addressed target with the same name has the same bytes
+        return self._settings.fingerprint == 'content' and\
+            self.fingerprinted and cache_entry is not None and\
+            cache_entry.target == target_path and\
+            os.path.exists(target_path)
+
+    def build(self, cache_entry, force=False):
+        # safe to run in a worker thread: touches files only, the cache
+        # itself is updated by store() afterwards
+        with Profiler().measure('render', self):
+            self._render()
+        target_path = self._get_target_path()
+        if not force and self.is_unchanged(cache_entry, target_path):
+            return target_path, False
+
+        if cache_entry:
+            if os.path.exists(cache_entry.target):
+                os.remove(cache_entry.target)
+            remove_variants(cache_entry.target)
+        PartialCache().invalidate(self._path, self._lang)
+
+        with Profiler().measure('write', self):
+            self._compile(target_path)
+        return target_path, True
+
+    def store(self, cache_entry, target_path, changed=True):
+        if not changed:
+            self._tool_cache.update(cache_entry, self._checksum)
+            if self._settings.verbose:
+                print('Unchanged {asset}'.format(asset=self))
+            return
+
+        if cache_entry:
+            cache_entry.target = target_path
+            cache_entry.update_built()
+            self._tool_cache.update(cache_entry, self._checksum)
+            print('Updated {asset}'.format(asset=self))
+        else:
+            cache_entry = self._tool_cache.new_entry(
+                self._path, target_path, self._lang, self._checksum)
+            self._tool_cache.add(cache_entry)
+            print('Created {asset}'.format(asset=self))
+        self._flag_modified = True
 
-                target_path = self._get_target_path()
-                self._compile(target_path)
+    def report_cached(self):
+        if self._settings.verbose:
+            print('Cached {asset}'.format(asset=self))
 
-                if cache_entry:
-                    cache_entry.target = target_path
-                    self._tool_cache.update(cache_entry)
-                    print('Updated {asset}'.format(asset=self))
-                else:
-                    cache_entry = CacheEntry(self._path, target_path, self._lang)
-                    self._tool_cache.add(cache_entry)
-                    print('Created {asset}'.format(asset=self))
-                self._flag_modified = True
+    def compile(self, force=False):
+        if self._resource_type == Asset.FILE:
+            outdated, cache_entry = self.is_outdated(force)
+            if outdated:
+                with Profiler().measure('compile', self):
+                    target_path, changed = self.build(cache_entry, force)
+                self.store(cache_entry, target_path, changed)
             else:
-                if self._settings.verbose:
-                    print('Cached {asset}'.format(asset=self))
+                self.report_cached()
         else:
             print("String asset")
 
 
+class SharedSource(object):
+    # source text and expression matches of a file, loaded and parsed once
+    # for all of its localized assets
+    def __init__(self, path):
+        self._path = path
+        self._stat = None
+        self._data = None
+        self._matches = None
+        # languages of the assets holding the text until they release it
+        self._holders = set()
+        self._lock = threading.Lock()
+
+    def load(self, lang, resolvers, spans=None):
+        with self._lock:
+            self._holders.add(lang)
+            stat = os.stat(self._path)
+            stat = (stat.st_mtime, stat.st_size)
+            if self._data is None or stat != self._stat:
+                with io.open(self._path, 'r', encoding='utf-8') as f:
+                    self._data = f.read()
+                self._stat = stat
+                self._matches = None
+            if self._matches is None and spans is not None:
+                self._matches = find_matches_at(self._data, resolvers, spans)
+            if self._matches is None:
+                self._matches = find_matches(self._data, resolvers)
+            return self._data, self._matches
+
+    def release(self, lang):
+        # the text is dropped once every asset that loaded it has released
+        # it, variants that are not built never hold it
+        with self._lock:
+            self._holders.discard(lang)
+            if len(self._holders) == 0:
+                self._data = None
+                self._matches = None
+
+
 class TextAsset(Asset):
-    def __init__(self, path, lang=None):
+    def __init__(self, path, lang=None, shared=None):
         super(TextAsset, self).__init__(Asset.FILE, path, lang)
         self._data = None
+        self._shared = shared
+        self._resolvers = None
+        self._processor = None
+        # expression offsets known from the parse cache
+        self._spans = None
 
         split = os.path.splitext(path)
         self._basename = split[0]
         self._extension = split[1]
 
     def load(self):
+        # returns the expression matches if they are shared with the other
+        # localized assets of the same source
+        if self._shared is not None:
+            self._data, matches = self._shared.load(self._lang,
+                                                    self._resolvers,
+                                                    self._spans)
+            return matches
         with io.open(self._path, 'r', encoding='utf-8') as f:
             self._data = f.read()
+        return None
+
+    def parse_expressions(self, resolvers):
+        self._resolvers = resolvers
+        if self._settings.parse_cache and self._restore():
+            return
+        self._spans = None
+        self._processor = self._create_processor()
+        if self._settings.parse_cache:
+            self._spans = self._processor.get_spans()
+            ParseCache().store(self._path, self._lang,
+                               get_parser_key(resolvers),
+                               self._requested_dependencies, self._spans)
+
+    def _restore(self):
+        # an unchanged source gets its dependencies from the parse cache,
+        # the text is read only if the asset has to be built
+        parse_cache = ParseCache()
+        entry = parse_cache.find_entry(self._path, self._lang)
+        if entry is None or self._settings.force or\
+                not parse_cache.is_valid(entry,
+                                         get_parser_key(self._resolvers),
+                                         self._stat):
+            return False
+        dependencies, self._spans = parse_cache.load(entry)
+        for path, lang in dependencies:
+            self.add_dependency(path, lang)
+        self._data = None
+        self._processor = None
+        return True
+
+    def get_processor(self):
+        if self._processor is None:
+            # reloaded after release(), the dependencies are already known
+            self._track_dependencies = False
+            try:
+                self._processor = self._create_processor()
+            finally:
+                self._track_dependencies = True
+        return self._processor
+
+    def _create_processor(self):
+        matches = self.load()
+        if matches is None and self._spans is not None:
+            matches = find_matches_at(self._data, self._resolvers,
+                                      self._spans)
+        processor = ExpressionProcessor(self, self._resolvers)
+        processor.parse(matches)
+        return processor
+
+    def release(self):
+        # drops the source text and parsed expressions until the asset
+        # is built, so only assets in flight keep their data in memory
+        self._data = None
+        self._processor = None
+        if self._shared is not None:
+            self._shared.release(self._lang)
+
+    def build(self, cache_entry, force=False):
+        try:
+            return super(TextAsset, self).build(cache_entry, force)
+        finally:
+            if self._settings.lazy_load:
+                self.release()
 
     def save(self, path):
         if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
+            make_dirs(os.path.dirname(path))
         save_file(path, self._data)
 
+    def minify(self, target_path):
+        self._collection.minifier.minify(self, target_path)
+
+    def _get_content_hash(self):
+        return get_data_hash(self._data.encode('utf-8'), short=True)
+
+    def needs_processing(self):
+        return self._settings.minify and not self.is_partial(self._path)
+
+    def is_cached_partial(self):
+        return self.is_partial(self._path) and PartialCache().enabled
+
+    def is_streamed(self):
+        # without post-processing the output goes straight to the target
+        return self._settings.fingerprint != 'content' and\
+            not self.needs_processing() and not self.is_cached_partial()
+
+    def stream(self, path):
+        if not os.path.exists(os.path.dirname(path)):
+            make_dirs(os.path.dirname(path))
+        with io.open(path, 'w', encoding='utf-8') as f:
+            self.get_processor().write(self._settings, path, f)
+
+    def _render(self):
+        if not self.is_streamed():
+            self.get_processor().compile(self._settings, None)
+
+    def _compile(self, target_path):
+        if self.is_streamed():
+            self.stream(target_path)
+        elif self._settings.minify and not self.is_partial(target_path):
+            if self._settings.verbose:
+                print('Minifying {asset}'.format(asset=self))
+            self.minify(target_path)
+        else:
+            self.save(target_path)
+            if self.is_cached_partial():
+                PartialCache().put(self._path, self._lang, self._data)
+
 
 class StylesheetAsset(TextAsset):
+    minify_type = 'css'
+    fingerprinted = True
+
     @staticmethod
     def supported_extensions():
         return ['.css', '.scss']
@@ -223,54 +718,20 @@ class StylesheetAsset(TextAsset):
         return self._settings.stylesheets.target
 
     def _get_target_path(self):
-        return self.get_target_path(hash=get_file_hash(self._path, unique=True))
+        return self.get_target_path(hash=self.get_fingerprint())
 
     def _parse(self):
-        self.load()
-        self._processor = ExpressionProcessor(self, [
+        self.parse_expressions([
             stylesheets.ImageUrlExpression,
             stylesheets.IncludeExpression,
             stylesheets.FontUrlExpression
         ])
-        self._processor.parse()
-
-    def minify(self):
-        temp_path = tempfile.mkdtemp()
-
-        source_file = os.path.join(temp_path, "source.css")
-        save_file(source_file, self._data)
-        target_file = os.path.join(temp_path, "target.css")
-
-        proc = subprocess.Popen(
-            [
-                "java",
-                "-Xss100m",
-                "-jar",
-                self._settings.yuicompressor_file,
-                "--type",
-                "css",
-                "-o",
-                target_file,
-                source_file
-            ],
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-        )
-        out, err = proc.communicate()
-
-        self._data = load_file(target_file)
-        shutil.rmtree(temp_path)
-
-    def _compile(self, target_path):
-        self._processor.compile(self._settings, target_path)
-        if self._settings.minify and not self.is_partial(target_path):
-            if self._settings.verbose:
-                print('Minifying {asset}'.format(asset=self))
-            self.minify()
-        self.save(target_path)
 
 
 class ScriptAsset(TextAsset):
+    minify_type = 'js'
+    fingerprinted = True
+
     @staticmethod
     def supported_extensions():
         return ['.js', '.coffee']
@@ -290,80 +751,40 @@ class ScriptAsset(TextAsset):
 
     def _get_target_path(self):
         return self.get_target_path(
-            hash=get_file_hash(self._path, unique=True),
+            hash=self.get_fingerprint(),
             change_extension='.js'
         )
 
     def _parse(self):
-        self.load()
-        self._processor = ExpressionProcessor(self, [
+        self.parse_expressions([
             scripts.IncludeExpression,
             scripts.ScriptUrlExpression,
             scripts.AppConfExpression,
             scripts.ResourceUrlExpression
         ])
-        self._processor.parse()
-
-    def minify(self):
-        temp_path = tempfile.mkdtemp()
-
-        source_file = os.path.join(temp_path, "source.js")
-        save_file(source_file, self._data)
-        target_file = os.path.join(temp_path, "target.js")
-
-        proc = subprocess.Popen(
-            [
-                "java",
-                "-jar",
-                self._settings.yuicompressor_file,
-                "--type",
-                "js",
-                "-o",
-                target_file,
-                source_file
-            ],
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE,
-        )
-        out, err = proc.communicate()
-
-        self._data = load_file(target_file)
-        shutil.rmtree(temp_path)
 
-    def compile_coffee(self):
-        temp_path = tempfile.mkdtemp()
+    def is_coffee(self):
+        return self._extension == '.coffee'
 
-        source_file = os.path.join(temp_path, "source.coffee")
-        save_file(source_file, self._data)
-        target_file = os.path.join(temp_path, "source.js")
+    def render_source(self):
+        super(ScriptAsset, self)._render()
 
-        proc = subprocess.Popen(
-            [
-                self._settings.coffee_bin,
-                "-c",
-                source_file
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
-        out, err = proc.communicate()
+    def needs_processing(self):
+        return self.is_coffee() or\
+            super(ScriptAsset, self).needs_processing()
 
-        self._data = load_file(target_file)
-        shutil.rmtree(temp_path)
-
-    def _compile(self, target_path):
-        self._processor.compile(self._settings, target_path)
-        if self._extension == '.coffee':
+    def _render(self):
+        if self.is_coffee():
             if self._settings.verbose:
                 print('Using CoffeeScript Compiler for {asset}'.format(asset=self))
-            self.compile_coffee()
-        if self._settings.minify and not self.is_partial(target_path):
-            if self._settings.verbose:
-                print('Minifying {asset}'.format(asset=self))
-            self.minify()
-        self.save(target_path)
+            self._collection.coffee.render(self)
+        else:
+            self.render_source()
 
 
 class HtmlAsset(TextAsset):
+    minify_type = 'html'
+
     @staticmethod
     def supported_extensions():
         return ['.html']
@@ -385,8 +806,7 @@ class HtmlAsset(TextAsset):
         return self.get_target_path(lang=self._lang)
 
     def _parse(self):
-        self.load()
-        self._processor = ExpressionProcessor(self, [
+        self.parse_expressions([
             html.IncludeExpression,
             html.StylesheetUrlExpression,
             html.ScriptUrlExpression,
@@ -396,60 +816,51 @@ class HtmlAsset(TextAsset):
             html.I18nTemplateExpression,
             html.ResourceUrlExpression
         ])
-        self._processor.parse()
-
-    def minify(self):
-        temp_path = tempfile.mkdtemp()
-
-        source_file = os.path.join(temp_path, "source.html")
-        save_file(source_file, self._data)
-        target_file = os.path.join(temp_path, "target.html")
-
-        proc = subprocess.Popen(
-            [
-                "java",
-                "-jar",
-                self._settings.htmlcompressor_file,
-                "--type",
-                "html",
-                "--mask",
-                "*.html",
-                "-o",
-                target_file,
-                source_file,
-                "--remove-intertag-spaces"
-            ],
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE
-        )
-        out, err = proc.communicate()
-
-        self._data = load_file(target_file)
-        shutil.rmtree(temp_path)
-
-    def _compile(self, target_path):
-        self._processor.compile(self._settings, target_path)
-        if self._settings.minify and not self.is_partial(target_path):
-            if self._settings.verbose:
-                print('Minifying {asset}'.format(asset=self))
-            self.minify()
-        self.save(target_path)
 
 
 class BinaryAsset(Asset):
+    fingerprinted = True
+
     def __init__(self, path, lang=None):
         super(BinaryAsset, self).__init__(Asset.FILE, path, lang)
 
-    def _get_target_path(self):
-        return self.get_target_path(hash=get_file_hash(self._path, unique=True))
-
     def _parse(self):
         pass
 
-    def _compile(self, target_path):
-        if not os.path.exists(os.path.dirname(target_path)):
-            os.makedirs(os.path.dirname(target_path))
-        shutil.copy(self._path, target_path)
+    def build(self, cache_entry, force=False):
+        # the file is copied under a temporary name while it is hashed, the
+        # target name is known only when the copy is done
+        checksum_hash = FileHashes().new_hash()
+        hashers = [checksum_hash]
+        if self._settings.fingerprint == 'content':
+            fingerprint_hash = checksum_hash
+        else:
+            fingerprint_hash = sha256()
+            fingerprint_hash.update(os.urandom(32))
+            hashers.append(fingerprint_hash)
+
+        target_dir = os.path.dirname(self.get_target_path(hash=''))
+        if not os.path.exists(target_dir):
+            make_dirs(target_dir)
+        temp_path = get_temp_path(target_dir, os.path.basename(self._path))
+        with Profiler().measure('copy', self):
+            copy_file(self._path, temp_path, hashers,
+                      self._settings.binary_copy)
+
+        self._checksum = shorten_digest(checksum_hash.hexdigest())
+        FileHashes().remember(self._path, self._checksum)
+        target_path = self.get_target_path(
+            hash=shorten_digest(fingerprint_hash.hexdigest()))
+        if not force and self.is_unchanged(cache_entry, target_path):
+            os.remove(temp_path)
+            return target_path, False
+
+        if cache_entry:
+            if os.path.exists(cache_entry.target):
+                os.remove(cache_entry.target)
+            remove_variants(cache_entry.target)
+        os.rename(temp_path, target_path)
+        return target_path, True
 
 
 class ImageAsset(BinaryAsset):
@@ -496,8 +907,8 @@ class FontAsset(BinaryAsset):
         return self._settings.fonts.target
 
 
-def get_asset_objects(path, settings):
-    asset_classes = [
+def get_asset_classes():
+    return [
         ImageAsset,
         FontAsset,
         StylesheetAsset,
@@ -505,12 +916,26 @@ def get_asset_objects(path, settings):
         ScriptAsset
     ]
 
+
+def get_supported_extensions():
+    extensions = set()
+    for asset_class in get_asset_classes():
+        extensions.update(asset_class.supported_extensions())
+    return extensions
+
+
+def get_asset_objects(path, settings):
+    asset_classes = get_asset_classes()
+
     file_ext = os.path.splitext(path)[1]
     for asset_class in asset_classes:
         if file_ext in asset_class.supported_extensions():
             langs = asset_class.get_languages(settings)
             if langs is None:
                 return asset_class(path, None)
+            elif issubclass(asset_class, TextAsset):
+                shared = SharedSource(path)
+                return [asset_class(path, lang, shared) for lang in langs]
             else:
                 return [asset_class(path, lang) for lang in langs]
 
@@ -1,36 +1,213 @@
-from .models import CacheEntry
 from . import db
+from .compress import remove_variants
+from .profiler import Profiler
+from collections import OrderedDict
+import json
 import os
+import sys
+import threading
+
+
+def get_key(path, lang):
+    # include paths like sub/../partial name the same source
+    return os.path.normpath(path), lang
 
 
 class Cache(object):
     def __new__(cls, commit=False):
         if not hasattr(cls, 'instance'):
             cls.instance = super(Cache, cls).__new__(cls)
-            cls.instance.entries = CacheEntry.query.all()
+            with Profiler().measure('cache.load'):
+                cls.instance.entries = db.store.load(
+                    db.store.cache_entry_class)
+            cls.instance._index = {}
+            for entry in cls.instance.entries:
+                cls.instance._index.setdefault(
+                    get_key(entry.source, entry.lang), entry)
+            cls.instance._batch_size = 1
+            cls.instance._pending = 0
         return cls.instance
 
+    def set_batch_size(self, batch_size):
+        # 1 - commit after every change, 0 - commit only on flush,
+        # N - commit after every N changes
+        self._batch_size = batch_size
+
     def check(self):
+        alive = []
         for entry in self.entries:
             if not os.path.exists(entry.source):
                 if os.path.exists(entry.target):
                     os.remove(entry.target)
-                db.db_session.delete(entry)
+                remove_variants(entry.target)
+                db.store.delete(entry)
+                key = get_key(entry.source, entry.lang)
+                if self._index.get(key) is entry:
+                    del self._index[key]
+            else:
+                alive.append(entry)
+        self.entries = alive
 
-        db.db_session.commit()
+        db.store.commit()
 
     def find_entry(self, source, lang=None):
-        for entry in self.entries:
-            if entry.source == source and entry.lang == lang:
-                return entry
-        return None
+        return self._index.get(get_key(source, lang))
+
+    def new_entry(self, source, target, lang=None, checksum=None):
+        return db.store.cache_entry_class(source, target, lang, checksum)
 
     def add(self, entry):
-        self.entries.append(entry)
-        db.db_session.add(entry)
-        db.db_session.commit()
+        with Profiler().measure('cache.add'):
+            self.entries.append(entry)
+            self._index.setdefault(get_key(entry.source, entry.lang), entry)
+            db.store.add(entry)
+            self._commit()
 
-    def update(self, entry):
+    def update(self, entry, checksum=None):
+        with Profiler().measure('cache.update'):
+            entry.update_last_modified()
+            entry.update_size()
+            entry.update_checksum(checksum)
+            self._index[get_key(entry.source, entry.lang)] = entry
+            db.store.add(entry)
+            self._commit()
+
+    def refresh(self, entry):
+        # the source was touched but its content is the same
         entry.update_last_modified()
+        entry.update_size()
+        db.store.add(entry)
+        self._commit()
+
+    def flush(self):
+        if self._pending > 0:
+            with Profiler().measure('cache.commit'):
+                db.store.commit()
+            self._pending = 0
+
+    def _commit(self):
+        self._pending += 1
+        if self._batch_size > 0 and self._pending >= self._batch_size:
+            self.flush()
+
+
+class ParseCache(object):
+    # dependencies and expression offsets of parsed sources by
+    # (source, lang), so unchanged files need not be read at all
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(ParseCache, cls).__new__(cls)
+            cls.instance._index = {}
+            with Profiler().measure('cache.load'):
+                for entry in db.store.load(db.store.parse_entry_class):
+                    cls.instance._index[(entry.source, entry.lang)] = entry
+            cls.instance._pending = False
+        return cls.instance
+
+    def check(self):
+        for key, entry in list(self._index.items()):
+            if not os.path.exists(entry.source):
+                db.store.delete(entry)
+                del self._index[key]
+                self._pending = True
+
+    def find_entry(self, source, lang=None):
+        return self._index.get((source, lang))
+
+    def is_valid(self, entry, parser, stat=None):
+        if entry.parser != parser:
+            return False
+        if not entry.stat_modified(stat):
+            return True
+        if entry.content_modified(stat):
+            return False
+        # the source was touched but its content is the same
+        entry.update_last_modified()
+        entry.update_size()
+        db.store.add(entry)
+        self._pending = True
+        return True
+
+    def load(self, entry):
+        # [(path, lang)] requested dependencies, [(start, end)] expressions
+        return json.loads(entry.dependencies), json.loads(entry.expressions)
+
+    def store(self, source, lang, parser, dependencies, spans):
+        entry = self._index.get((source, lang))
+        if entry is None:
+            entry = db.store.parse_entry_class(source, lang)
+            self._index[(source, lang)] = entry
+        entry.update_last_modified()
+        entry.update_size()
         entry.update_checksum()
-        db.db_session.commit()
+        entry.parser = parser
+        entry.dependencies = json.dumps(dependencies)
+        entry.expressions = json.dumps(spans)
+        db.store.add(entry)
+        self._pending = True
+
+    def flush(self):
+        if self._pending:
+            with Profiler().measure('cache.commit'):
+                db.store.commit()
+            self._pending = False
+
+
+class PartialCache(object):
+    # compiled partial contents keyed by (source, lang), least recently
+    # used entries are dropped when their total size exceeds max_size bytes
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(PartialCache, cls).__new__(cls)
+            cls.instance._entries = OrderedDict()
+            cls.instance._size = 0
+            cls.instance._max_size = 0
+            cls.instance._lock = threading.Lock()
+        return cls.instance
+
+    @property
+    def enabled(self):
+        return self._max_size > 0
+
+    def set_max_size(self, max_size):
+        with self._lock:
+            self._max_size = max_size
+            self._shrink()
+
+    def get(self, source, lang=None):
+        with self._lock:
+            key = get_key(source, lang)
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._entries[key] = data
+            return data
+
+    def put(self, source, lang, data):
+        with self._lock:
+            key = get_key(source, lang)
+            self._remove(key)
+            size = self._get_size(data)
+            if size > self._max_size:
+                return
+            self._entries[key] = data
+            self._size += size
+            self._shrink()
+
+    def invalidate(self, source, lang=None):
+        with self._lock:
+            self._remove(get_key(source, lang))
+
+    def _remove(self, key):
+        data = self._entries.pop(key, None)
+        if data is not None:
+            self._size -= self._get_size(data)
+
+    def _shrink(self):
+        while self._size > self._max_size:
+            key, data = self._entries.popitem(last=False)
+            self._size -= self._get_size(data)
+
+    @staticmethod
+    def _get_size(data):
+        # memory taken by the string, len() would count characters
+        return sys.getsizeof(data)
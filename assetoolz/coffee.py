@@ -0,0 +1,149 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from .utils import save_file, load_file
+from .profiler import Profiler
+from .tools import ToolError, run_tool
+
+
+class CoffeeError(ToolError):
+    pass
+
+
+class ProcessCoffeeCompiler(object):
+    # one coffee process per asset
+    batched = False
+
+    def __init__(self, settings):
+        self._settings = settings
+
+    def render(self, asset):
+        asset.render_source()
+        self.compile(asset)
+
+    def compile(self, asset):
+        with Profiler().measure('coffee', asset):
+            asset._data = self._compile(asset._path, asset._data)
+
+    def _compile(self, path, data):
+        try:
+            if self._settings.tool_io == 'pipe':
+                return run_tool([
+                    self._settings.coffee_bin,
+                    "-s",
+                    "-c"
+                ], data)
+            return self._compile_file(data)
+        except ToolError as e:
+            raise CoffeeError('Failed to compile {path}: {error}'.format(
+                path=path, error=e))
+
+    def _compile_file(self, data):
+        temp_path = tempfile.mkdtemp()
+        try:
+            source_file = os.path.join(temp_path, "source.coffee")
+            save_file(source_file, data)
+            target_file = os.path.join(temp_path, "source.js")
+
+            run_tool([
+                self._settings.coffee_bin,
+                "-c",
+                source_file
+            ])
+
+            return load_file(target_file)
+        finally:
+            shutil.rmtree(temp_path)
+
+    def prepare(self, assets, force=False):
+        pass
+
+
+class BatchCoffeeCompiler(ProcessCoffeeCompiler):
+    # outdated CoffeeScript assets are rendered up front and compiled by a
+    # single coffee process, render() then picks up the prepared result
+    batched = True
+
+    def __init__(self, settings):
+        super(BatchCoffeeCompiler, self).__init__(settings)
+        self._results = {}
+
+    def render(self, asset):
+        data = self._results.pop((asset._path, asset._lang), None)
+        if data is None:
+            super(BatchCoffeeCompiler, self).render(asset)
+        else:
+            asset._data = data
+
+    def prepare(self, assets, force=False):
+        pending = []
+        for asset in assets:
+            if not asset.is_coffee():
+                continue
+            outdated, cache_entry = asset.is_outdated(force)
+            if outdated:
+                with Profiler().measure('render', asset):
+                    asset.render_source()
+                pending.append(asset)
+        if len(pending) > 0:
+            with Profiler().measure('coffee', '{0:d} assets'.format(
+                    len(pending))):
+                self._run_batch(pending)
+
+    def _run_batch(self, assets):
+        temp_path = tempfile.mkdtemp()
+        try:
+            source_dir = os.path.join(temp_path, 'source')
+            output_dir = os.path.join(temp_path, 'output')
+            sources = []
+            for index, asset in enumerate(assets):
+                source_file = os.path.join(
+                    source_dir, '{0:d}.coffee'.format(index))
+                save_file(source_file, asset._data)
+                sources.append(source_file)
+            os.makedirs(output_dir)
+
+            proc = subprocess.Popen(
+                [
+                    self._settings.coffee_bin,
+                    "-c",
+                    "-o",
+                    output_dir
+                ] + sources,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+            out, err = proc.communicate()
+
+            # files compiled before coffee hit a broken one are kept
+            failed = []
+            for index, asset in enumerate(assets):
+                target_file = os.path.join(
+                    output_dir, '{0:d}.js'.format(index))
+                if os.path.exists(target_file):
+                    self._results[(asset._path, asset._lang)] =\
+                        load_file(target_file)
+                else:
+                    failed.append(asset)
+        finally:
+            shutil.rmtree(temp_path)
+
+        # coffee stops at the first broken file, the rest are compiled one
+        # by one so that every error is reported with its own file name
+        errors = []
+        for asset in failed:
+            try:
+                self._results[(asset._path, asset._lang)] =\
+                    self._compile(asset._path, asset._data)
+            except CoffeeError as e:
+                print(e)
+                errors.append(asset)
+        if len(errors) > 0:
+            raise CoffeeError('Failed to compile {count:d} CoffeeScript '
+                              'assets'.format(count=len(errors)))
+
+
+def get_coffee_compiler(settings):
+    if settings.coffee_backend == 'batch':
+        return BatchCoffeeCompiler(settings)
+    return ProcessCoffeeCompiler(settings)
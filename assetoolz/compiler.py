@@ -1,24 +1,123 @@
+import hashlib
 import re
 from .expressions import ExpressionSettings
 
 
-def get_match_expression_class(match_obj, classes):
-    for class_name in classes:
-        matches = False
-        for param in class_name.get_regex_params():
-            # one match is enough
-            if match_obj.group(param) is not None:
-                matches = True
-        if matches:
-            return class_name
-    return None
+MARKER_LENGTH = 3
+REGEX_SPECIAL = '.^$*+?{}[]|()'
+
+_patterns = {}
 
 
 def get_expressions_regex(classes):
-    grouped = ["(%s)" % x.get_regex() for x in classes]
+    grouped = ["(?P<expr_%d>%s)" % (index, x.get_regex())
+               for index, x in enumerate(classes)]
     return "|".join(grouped)
 
 
+def has_top_level_alternation(regex):
+    depth = 0
+    in_class = False
+    index = 0
+    while index < len(regex):
+        char = regex[index]
+        if char == '\\':
+            index += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+            if regex[index + 1:index + 2] == '^':
+                index += 1
+            if regex[index + 1:index + 2] == ']':
+                index += 1
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+        index += 1
+    return False
+
+
+def get_literal_prefix(regex):
+    # None when the regex has no single literal prefix
+    if has_top_level_alternation(regex):
+        return None
+    prefix = ''
+    index = 0
+    while index < len(regex):
+        char = regex[index]
+        if char == '\\':
+            # \s, \d, \1 and the like are not literal characters
+            if index + 1 >= len(regex) or regex[index + 1].isalnum():
+                break
+            char = regex[index + 1]
+            index += 2
+        elif char in REGEX_SPECIAL:
+            break
+        else:
+            index += 1
+        if index < len(regex) and regex[index] in '?*{':
+            # the character is optional
+            break
+        prefix += char
+    return prefix
+
+
+def get_pattern(resolvers):
+    # compiled regex, group name to class table, the literal markers one
+    # of which must be present in the text for any expression to match
+    # and a digest of the combined regex
+    key = tuple(resolvers)
+    pattern = _patterns.get(key)
+    if pattern is None:
+        regex = re.compile(get_expressions_regex(resolvers))
+        classes = dict(("expr_%d" % index, class_name)
+                       for index, class_name in enumerate(resolvers))
+        prefixes = [get_literal_prefix(class_name.get_regex())
+                    for class_name in resolvers]
+        if any(prefix is None or len(prefix) < MARKER_LENGTH
+               for prefix in prefixes):
+            markers = None
+        else:
+            markers = set(prefix[:MARKER_LENGTH] for prefix in prefixes)
+        digest = hashlib.sha1(regex.pattern.encode('utf-8')).hexdigest()
+        pattern = (regex, classes, markers, digest)
+        _patterns[key] = pattern
+    return pattern
+
+
+def get_parser_key(resolvers):
+    return get_pattern(resolvers)[3]
+
+
+def find_matches(data, resolvers):
+    regex, classes, markers, digest = get_pattern(resolvers)
+    if markers is not None and\
+            not any(marker in data for marker in markers):
+        return []
+    # the outer group of the matched alternative is closed last
+    return [(classes[match.lastgroup], match)
+            for match in regex.finditer(data)]
+
+
+def find_matches_at(data, resolvers, spans):
+    # repeats the matches of an earlier parse at their known offsets,
+    # None if the text does not match there any more
+    regex, classes, markers, digest = get_pattern(resolvers)
+    matches = []
+    for start, end in spans:
+        match = regex.match(data, start)
+        if match is None or match.end() != end:
+            return None
+        matches.append((classes[match.lastgroup], match))
+    return matches
+
+
 class ExpressionProcessor(object):
     def __init__(self, asset, resolvers):
         self._asset = asset
@@ -26,31 +125,33 @@ class ExpressionProcessor(object):
         self._resolvers = resolvers
         self._expressions = []
 
-    def parse(self):
-        group_regex = get_expressions_regex(self._resolvers)
-        for match in re.finditer(group_regex, self._data):
-            class_name = get_match_expression_class(
-                match, self._resolvers)
+    def parse(self, matches=None):
+        # matches may come from another asset with the same source text
+        if matches is None:
+            matches = find_matches(self._data, self._resolvers)
+        for class_name, match in matches:
+            expr = class_name(ExpressionSettings(
+                self, self._asset, match))
+            self._expressions.append(expr)
 
-            if class_name is not None:
-                expr = class_name(ExpressionSettings(
-                    self, self._asset, match))
-                self._expressions.append(expr)
+    def get_spans(self):
+        return [list(expression.settings.match.span())
+                for expression in self._expressions]
 
-    def compile(self, settings, path):
-        result = ''
+    def iter_fragments(self, settings, path):
         start = 0
-        end = len(self._data)
         for expression in self._expressions:
             span = expression.settings.match.span()
-            end = span[0]
-
-            result += self._data[start:end]
-            expr_result = expression(settings=settings, path=path)
-
-            result += expr_result
+            yield self._data[start:span[0]]
+            yield expression(settings=settings, path=path)
             start = span[1]
-            end = len(self._data)
+        yield self._data[start:]
+
+    def compile(self, settings, path):
+        self._asset._data = ''.join(self.iter_fragments(settings, path))
 
-        result += self._data[start:end]
-        self._asset._data = result
+    def write(self, settings, path, stream):
+        for fragment in self.iter_fragments(settings, path):
+            if isinstance(fragment, bytes):
+                fragment = fragment.decode('utf-8')
+            stream.write(fragment)
@@ -0,0 +1,85 @@
+import gzip
+import io
+import os
+from multiprocessing.pool import ThreadPool
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+VARIANT_SUFFIXES = ['.gz', '.br']
+
+
+def remove_variants(path):
+    for suffix in VARIANT_SUFFIXES:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def variant_outdated(path, variant_path):
+    if not os.path.exists(variant_path):
+        return True
+    return os.path.getmtime(variant_path) < os.path.getmtime(path)
+
+
+def write_gzip(path, data, level):
+    with io.open(path, 'wb') as f:
+        # no file name and zero mtime in the header keep the output stable
+        gz = gzip.GzipFile(filename='', mode='wb', compresslevel=level,
+                           fileobj=f, mtime=0)
+        try:
+            gz.write(data)
+        finally:
+            gz.close()
+
+
+def write_brotli(path, data, quality):
+    with io.open(path, 'wb') as f:
+        f.write(brotli.compress(data, quality=quality))
+
+
+class Precompressor(object):
+    def __init__(self, settings, jobs=1):
+        self._settings = settings
+        self._jobs = jobs
+
+    def is_compressible(self, path):
+        extension = os.path.splitext(path)[1]
+        return extension in self._settings.extensions
+
+    def compress(self, path, force=False):
+        if os.path.getsize(path) < self._settings.min_size:
+            remove_variants(path)
+            return 0
+
+        variants = [('.gz', write_gzip, self._settings.gzip_level)]
+        if brotli is not None:
+            variants.append(
+                ('.br', write_brotli, self._settings.brotli_quality))
+
+        data = None
+        written = 0
+        for suffix, writer, level in variants:
+            variant_path = path + suffix
+            if not force and not variant_outdated(path, variant_path):
+                continue
+            if data is None:
+                with io.open(path, 'rb') as f:
+                    data = f.read()
+            writer(variant_path, data, level)
+            written += 1
+        return written
+
+    def run(self, paths, force=False):
+        paths = [path for path in paths
+                 if self.is_compressible(path) and os.path.exists(path)]
+        if len(paths) == 0:
+            return 0
+        pool = ThreadPool(self._jobs)
+        try:
+            counts = pool.map(lambda path: self.compress(path, force), paths)
+        finally:
+            pool.close()
+            pool.join()
+        return sum(counts)
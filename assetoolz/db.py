@@ -5,29 +5,79 @@ from functools import wraps
 import os
 
 db_session = None
+# storage used by the caches, see OrmStore and sqlitecache.SqliteStore
+store = None
 
 Model = declarative_base()
 
 
+def upgrade_schema(connection):
+    # columns added after the cache table was first created, works with
+    # an SQLAlchemy engine as well as a sqlite3 connection
+    columns = [row[1] for row in
+               connection.execute("PRAGMA table_info(cache)")]
+    if 'size' not in columns:
+        connection.execute("ALTER TABLE cache ADD COLUMN size INTEGER")
+    if 'built' not in columns:
+        connection.execute("ALTER TABLE cache ADD COLUMN built FLOAT")
+
+
+class OrmStore(object):
+    # cache entries are SQLAlchemy models tracked by the session
+    def __init__(self, session):
+        from .models import CacheEntry, ParseEntry
+        self._session = session
+        self.cache_entry_class = CacheEntry
+        self.parse_entry_class = ParseEntry
+
+    def load(self, entry_class):
+        return entry_class.query.all()
+
+    def add(self, entry):
+        self._session.add(entry)
+
+    def delete(self, entry):
+        self._session.delete(entry)
+
+    def commit(self):
+        self._session.commit()
+
+    def close(self):
+        self._session.remove()
+
+
+def open_orm_store(cache_db_path):
+    engine = create_engine("sqlite:///" + cache_db_path,
+                           convert_unicode=True)
+    global db_session
+    db_session = scoped_session(sessionmaker(autocommit=False,
+                                             autoflush=False,
+                                             expire_on_commit=False,
+                                             bind=engine))
+    global Model
+    Model.query = db_session.query_property()
+    from . import models
+    Model.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+    return OrmStore(db_session)
+
+
 def entry_point(func):
     @wraps(func)
     def internal(*args, **kwargs):
         result = None
-        cache_db_path = os.path.join(args[0].cache_path, "cache.db")
-        engine = create_engine("sqlite:///" + cache_db_path,
-                               convert_unicode=True)
-        global db_session
-        db_session = scoped_session(sessionmaker(autocommit=False,
-                                                 autoflush=False,
-                                                 bind=engine))
-        global Model
-        Model.query = db_session.query_property()
-        from . import models
-        Model.metadata.create_all(bind=engine)
+        settings = args[0]
+        cache_db_path = os.path.join(settings.cache_path, "cache.db")
+        global store
+        if settings.cache_backend == 'sqlite':
+            from .sqlitecache import SqliteStore
+            store = SqliteStore(cache_db_path)
+        else:
+            store = open_orm_store(cache_db_path)
         try:
             result = func(*args, **kwargs)
         finally:
-            db_session.remove()
+            store.close()
         return result
 
     return internal
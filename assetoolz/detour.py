@@ -1,4 +1,14 @@
+import fnmatch
 import os
+import stat
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 
 def detour_directory(path, func):
@@ -8,3 +18,61 @@ def detour_directory(path, func):
             func(full_path)
         elif os.path.isdir(full_path):
             detour_directory(full_path, func)
+
+
+def is_ignored(name, ignore):
+    for pattern in ignore:
+        if fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def iter_directory(path):
+    # name, full path, is directory, is file, stat function
+    if scandir is not None:
+        for entry in scandir(path):
+            yield (entry.name, entry.path, entry.is_dir(), entry.is_file(),
+                   entry.stat)
+    else:
+        # a single stat call per entry, like scandir on most platforms
+        for name in os.listdir(path):
+            full_path = os.path.join(path, name)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                # broken symlink or the entry is gone
+                continue
+            yield (name, full_path, stat.S_ISDIR(st.st_mode),
+                   stat.S_ISREG(st.st_mode), lambda st=st: st)
+
+
+def scan_directory(path, extensions=None, ignore=(), result=None):
+    # returns (path, stat) of every file with one of the extensions
+    if result is None:
+        result = []
+    for name, full_path, is_dir, is_file, get_stat in iter_directory(path):
+        if is_ignored(name, ignore):
+            continue
+        if is_file:
+            if extensions is not None and\
+                    os.path.splitext(name)[1] not in extensions:
+                continue
+            result.append((full_path, get_stat()))
+        elif is_dir:
+            scan_directory(full_path, extensions, ignore, result)
+    return result
+
+
+def scan_directories(paths, extensions=None, ignore=(), jobs=1):
+    # with several jobs every root is scanned on its own thread
+    scan = lambda path: scan_directory(path, extensions, ignore)
+    if jobs > 1 and len(paths) > 1:
+        pool = ThreadPool(min(jobs, len(paths)))
+        try:
+            results = pool.map(scan, paths)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [scan(path) for path in paths]
+    return [item for result in results for item in result]
@@ -1,5 +1,6 @@
 import os
 from ..utils import load_file
+from ..cache import PartialCache
 
 
 class ExpressionSettings(object):
@@ -46,11 +47,17 @@ class BaseIncludeExpression(BaseExpression):
             self.settings.asset._lang)
 
     def __call__(self, **opts):
+        lang = self.settings.asset._lang
         cache_entry = self.settings.asset._tool_cache.find_entry(
-            self._dependency_path,
-            self.settings.asset._lang)
+            self._dependency_path, lang)
         if cache_entry:
-            return load_file(cache_entry.target)
+            partial_cache = PartialCache()
+            data = partial_cache.get(self._dependency_path, lang)
+            if data is None:
+                data = load_file(cache_entry.target)
+                if partial_cache.enabled:
+                    partial_cache.put(self._dependency_path, lang, data)
+            return data
         return ""
 
     @staticmethod
@@ -0,0 +1,138 @@
+import binascii
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import io
+import os
+import shutil
+import sys
+
+CHUNK_SIZE = 1024 * 1024
+# linux ioctl for cloning a file on btrfs/xfs
+FICLONE = 0x40049409
+
+
+def get_libc_sendfile():
+    # os.sendfile appeared in Python 3.3, on Python 2 the libc function is
+    # called directly. Only the linux one copies between regular files
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        func = libc.sendfile64
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_int,
+                     ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    func.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        copied = func(out_fd, in_fd, ctypes.byref(ctypes.c_int64(offset)),
+                      count)
+        if copied < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        return copied
+
+    return sendfile
+
+
+if hasattr(os, 'sendfile'):
+    sendfile = os.sendfile
+else:
+    sendfile = get_libc_sendfile()
+
+
+def hash_file(path, hashers):
+    with io.open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            for hasher in hashers:
+                hasher.update(chunk)
+
+
+def copy_and_hash(source, target, hashers):
+    with io.open(source, 'rb') as src:
+        with io.open(target, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                for hasher in hashers:
+                    hasher.update(chunk)
+                dst.write(chunk)
+    shutil.copymode(source, target)
+
+
+def reflink(source, target):
+    with io.open(source, 'rb') as src:
+        with io.open(target, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            except IOError as e:
+                raise OSError(e.errno, e.strerror)
+    shutil.copymode(source, target)
+
+
+def copy_file_range(out_fd, in_fd, offset, count):
+    return os.copy_file_range(in_fd, out_fd, count, offset, offset)
+
+
+def copy_range(source, target, copy):
+    with io.open(source, 'rb') as src:
+        with io.open(target, 'wb') as dst:
+            size = os.fstat(src.fileno()).st_size
+            offset = 0
+            while offset < size:
+                copied = copy(dst.fileno(), src.fileno(), offset,
+                              size - offset)
+                if copied == 0:
+                    break
+                offset += copied
+
+
+def kernel_copy(source, target):
+    # the data does not pass through user space. copy_file_range fails
+    # across file systems and on older kernels, sendfile is tried then
+    calls = []
+    if hasattr(os, 'copy_file_range'):
+        calls.append(copy_file_range)
+    if sendfile is not None:
+        calls.append(sendfile)
+    if len(calls) == 0:
+        raise OSError(errno.ENOSYS, 'No in-kernel copy available')
+    error = None
+    for copy in calls:
+        try:
+            copy_range(source, target, copy)
+        except OSError as e:
+            error = e
+            continue
+        shutil.copymode(source, target)
+        return
+    raise error
+
+
+def get_temp_path(directory, name):
+    return os.path.join(directory, '.{0}.{1}.tmp'.format(
+        name, binascii.hexlify(os.urandom(8)).decode('ascii')))
+
+
+def copy_file(source, target, hashers, strategy='copy'):
+    # copies source to target and feeds its content to hashers, reading it
+    # only once. 'fast' tries a reflink and then an in-kernel copy, 'hardlink'
+    # tries a hard link first; all of them fall back to a plain copy
+    methods = []
+    if strategy == 'hardlink':
+        methods.append(os.link)
+    if strategy in ('hardlink', 'fast'):
+        methods.extend([reflink, kernel_copy])
+
+    for method in methods:
+        try:
+            method(source, target)
+        except OSError:
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        hash_file(source, hashers)
+        return
+
+    copy_and_hash(source, target, hashers)
@@ -0,0 +1,68 @@
+import io
+import json
+import os
+from .cache import Cache
+from .utils import get_file_hash, make_url_path
+
+
+class Manifest(object):
+    def __init__(self, path):
+        self._path = path
+        self._entries = {}
+        if os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get('assets', {})
+
+    @staticmethod
+    def get_key(asset):
+        name = asset.get_source_name().replace('\\', '/')
+        if asset._lang is None:
+            return name
+        return '{0}:{1}'.format(name, asset._lang)
+
+    def update(self, assets, settings):
+        tool_cache = Cache()
+        changed = False
+        keys = set()
+        for asset in assets:
+            cache_entry = tool_cache.find_entry(asset._path, asset._lang)
+            if cache_entry is None:
+                continue
+            url = make_url_path(settings.cdn_path, settings.cdn_url,
+                                cache_entry.target)
+            if not url:
+                # partials and pages outside of the CDN folder
+                continue
+
+            key = self.get_key(asset)
+            keys.add(key)
+            entry = self._entries.get(key)
+            if entry is not None and entry['url'] == url and\
+                    not asset._flag_modified:
+                continue
+
+            self._entries[key] = {
+                'source': asset.get_source_name().replace('\\', '/'),
+                'lang': asset._lang,
+                'url': url,
+                'size': os.path.getsize(cache_entry.target),
+                'digest': get_file_hash(cache_entry.target)
+            }
+            changed = True
+
+        for key in list(self._entries.keys()):
+            if key not in keys:
+                del self._entries[key]
+                changed = True
+
+        return changed or not os.path.exists(self._path)
+
+    def save(self):
+        temp_path = self._path + '.tmp'
+        with io.open(temp_path, 'wb') as f:
+            f.write(json.dumps({'assets': self._entries}, indent=2,
+                               sort_keys=True,
+                               separators=(',', ': ')).encode('utf-8'))
+        if os.name == 'nt' and os.path.exists(self._path):
+            os.remove(self._path)
+        os.rename(temp_path, self._path)
@@ -0,0 +1,199 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from .utils import save_file, load_file
+from .profiler import Profiler
+from .tools import ToolError, run_tool
+
+
+def get_minify_command(settings, minify_type, sources, output=None):
+    # without sources the compressor reads stdin, without output it
+    # writes to stdout
+    if minify_type == 'css':
+        command = [
+            "java",
+            "-Xss100m",
+            "-jar",
+            settings.yuicompressor_file,
+            "--type",
+            "css"
+        ]
+    elif minify_type == 'js':
+        command = [
+            "java",
+            "-jar",
+            settings.yuicompressor_file,
+            "--type",
+            "js"
+        ]
+    elif minify_type == 'html':
+        command = [
+            "java",
+            "-jar",
+            settings.htmlcompressor_file,
+            "--type",
+            "html",
+            "--mask",
+            "*.html",
+            "--remove-intertag-spaces"
+        ]
+    else:
+        raise ValueError('Unknown minify type {0}'.format(minify_type))
+    if output is not None:
+        command += ["-o", output]
+    return command + sources
+
+
+class ProcessMinifier(object):
+    # one compressor process per asset
+    def __init__(self, settings):
+        self._settings = settings
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _record(self, minify_type, count, runs, seconds):
+        with self._lock:
+            stats = self._stats.setdefault(minify_type, [0, 0, 0.0])
+            stats[0] += count
+            stats[1] += runs
+            stats[2] += seconds
+
+    def minify(self, asset, target_path):
+        with Profiler().measure('minify', asset):
+            try:
+                self._minify(asset, target_path)
+            except ToolError as e:
+                raise ToolError('Failed to minify {asset}: {error}'.format(
+                    asset=asset, error=e))
+
+    def _minify(self, asset, target_path):
+        started = time.time()
+        if self._settings.tool_io == 'pipe':
+            asset._data = run_tool(get_minify_command(
+                self._settings, asset.minify_type, []), asset._data)
+        else:
+            asset._data = self._minify_file(asset.minify_type, asset._data)
+        asset.save(target_path)
+        self._record(asset.minify_type, 1, 1, time.time() - started)
+
+    def _minify_file(self, minify_type, data):
+        temp_path = tempfile.mkdtemp()
+        try:
+            extension = '.' + minify_type
+            source_file = os.path.join(temp_path, "source" + extension)
+            save_file(source_file, data)
+            target_file = os.path.join(temp_path, "target" + extension)
+
+            run_tool(get_minify_command(
+                self._settings, minify_type, [source_file], target_file))
+
+            return load_file(target_file)
+        finally:
+            shutil.rmtree(temp_path)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def report(self):
+        for minify_type, stats in sorted(self._stats.items()):
+            print('Minified {count:d} {type} assets in {seconds:.2f}s '
+                  '({runs:d} runs)'.format(count=stats[0], type=minify_type,
+                                           seconds=stats[2], runs=stats[1]))
+
+
+class BatchMinifier(ProcessMinifier):
+    # assets are queued and compressed by a single compressor process per
+    # type, either when batch_size assets are queued or on flush()
+    def __init__(self, settings, batch_size=200):
+        super(BatchMinifier, self).__init__(settings)
+        self._batch_size = batch_size
+        self._temp_path = None
+        self._counter = 0
+        self._queues = {}
+
+    def minify(self, asset, target_path):
+        with self._lock:
+            if self._temp_path is None:
+                self._temp_path = tempfile.mkdtemp()
+            self._counter += 1
+            name = '{0:d}.{1}'.format(self._counter, asset.minify_type)
+            queue = self._queues.setdefault(asset.minify_type, [])
+        source_file = os.path.join(self._temp_path, 'source', name)
+        save_file(source_file, asset._data)
+
+        batch = None
+        with self._lock:
+            queue.append((source_file, target_path))
+            if len(queue) >= self._batch_size:
+                batch = list(queue)
+                del queue[:]
+        if batch is not None:
+            self._run(asset.minify_type, batch)
+
+    def _run(self, minify_type, batch):
+        with Profiler().measure('minify', '{0:d} {1} assets'.format(
+                len(batch), minify_type)):
+            self._run_batch(minify_type, batch)
+
+    def _run_batch(self, minify_type, batch):
+        started = time.time()
+        sources = [source_file for source_file, target_path in batch]
+        output_dir = tempfile.mkdtemp(dir=self._temp_path)
+        if minify_type == 'html':
+            output = output_dir + os.sep
+        else:
+            # YUI Compressor applies the pattern to every input file name
+            output = '.{0}$:.min.{0}'.format(minify_type)
+
+        try:
+            run_tool(get_minify_command(
+                self._settings, minify_type, sources, output))
+        except ToolError as e:
+            raise ToolError('Failed to minify {count:d} {type} assets: '
+                            '{error}'.format(count=len(batch),
+                                             type=minify_type, error=e))
+
+        for source_file, target_path in batch:
+            if minify_type == 'html':
+                result_file = os.path.join(
+                    output_dir, os.path.basename(source_file))
+            else:
+                result_file = '{0}.min.{1}'.format(
+                    os.path.splitext(source_file)[0], minify_type)
+            save_file(target_path, load_file(result_file))
+            os.remove(source_file)
+            os.remove(result_file)
+        shutil.rmtree(output_dir)
+        self._record(minify_type, len(batch), 1, time.time() - started)
+
+    def flush(self):
+        with self._lock:
+            queues = self._queues
+            self._queues = {}
+        try:
+            for minify_type, batch in sorted(queues.items()):
+                if len(batch) > 0:
+                    self._run(minify_type, batch)
+        finally:
+            self.close()
+
+    def close(self):
+        # drops whatever is still queued, also when the build failed before
+        # the queues were flushed
+        with self._lock:
+            self._queues = {}
+            temp_path = self._temp_path
+            self._temp_path = None
+        if temp_path is not None:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+
+def get_minifier(settings):
+    if settings.minify_backend == 'batch':
+        return BatchMinifier(settings, settings.minify_batch_size)
+    return ProcessMinifier(settings)
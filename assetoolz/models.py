@@ -1,49 +1,119 @@
 from .db import Model
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float
 import os
 import datetime
+import time
 from .utils import get_file_hash
 
 
-class CacheEntry(Model):
-    __tablename__ = "cache"
-    id = Column(Integer, primary_key=True)
-    source = Column(String(512))
-    target = Column(String(512))
-    lang = Column(String(10), nullable=True)
-    last_modified = Column(DateTime)
-    checksum = Column(String(64))
+class SourceState(object):
+    # stat and checksum of the source file an entry was made for
+    def update_checksum(self, checksum=None):
+        # the caller may pass a checksum it computed while reading the file
+        if checksum is None:
+            checksum = get_file_hash(self.source)
+        self.checksum = checksum
+
+    def update_size(self):
+        self.size = os.path.getsize(self.source)
+
+    def update_last_modified(self):
+        self.last_modified = datetime.datetime.fromtimestamp(
+            os.path.getmtime(self.source))
+
+    def stat_modified(self, stat=None):
+        if stat is None:
+            stat = os.stat(self.source)
+        if self.size is None or stat.st_size != self.size:
+            return True
+        source_last_mod = datetime.datetime.fromtimestamp(stat.st_mtime)
+        return source_last_mod != self.last_modified
 
-    def __init__(self, source, target, lang=None):
+    def content_modified(self, stat=None):
+        if stat is None:
+            stat = os.stat(self.source)
+        if self.size is not None and stat.st_size != self.size:
+            return True
+        return get_file_hash(self.source) != self.checksum
+
+
+class CacheEntryMixin(SourceState):
+    # behaviour shared by the SQLAlchemy model and plain sqlite3 records
+    def __init__(self, source, target, lang=None, checksum=None):
         self.source = source
         self.target = target
         self.lang = lang
         self.update_last_modified()
-        self.update_checksum()
+        self.update_size()
+        self.update_checksum(checksum)
+        self.update_built()
 
-    def update_checksum(self):
-        self.checksum = get_file_hash(self.source)
+    def update_built(self):
+        self.built = time.time()
 
-    def update_last_modified(self):
-        self.last_modified = datetime.datetime.fromtimestamp(
-            os.path.getmtime(self.source))
+    def built_after(self, other):
+        # True if this target was written after the other one
+        if self.built is None or other.built is None:
+            return False
+        return self.built > other.built
 
     def __repr__(self):
-        return "%d - s:'%s', t:'%s', m:'%s', c:'%s'" % (
+        return "%s - s:'%s', t:'%s', m:'%s', c:'%s'" % (
             self.id, self.source, self.target, self.last_modified,
             self.checksum)
 
+    # stat may be passed in when the caller already has the source stat
+    def file_modified(self, stat=None):
+        if not os.path.exists(self.target):
+            return True
+        if stat is None:
+            stat = os.stat(self.source)
+        source_last_mod = datetime.datetime.fromtimestamp(stat.st_mtime)
+        if source_last_mod > self.last_modified:
+            return True
+        return False
+
+
+class ParseEntryMixin(SourceState):
+    # dependencies and expression offsets found in a source file, valid
+    # while the file content and the expression patterns stay the same
+    def __init__(self, source, lang=None):
+        self.source = source
+        self.lang = lang
+
+    def __repr__(self):
+        return "%s - s:'%s', l:'%s', c:'%s'" % (
+            self.id, self.source, self.lang, self.checksum)
+
+
+class CacheEntry(CacheEntryMixin, Model):
+    __tablename__ = "cache"
+    id = Column(Integer, primary_key=True)
+    source = Column(String(512))
+    target = Column(String(512))
+    lang = Column(String(10), nullable=True)
+    last_modified = Column(DateTime)
+    checksum = Column(String(64))
+    size = Column(Integer, nullable=True)
+    # when the target was last written, NULL for entries made before
+    # the column was added
+    built = Column(Float, nullable=True)
+
     def __eq__(self, other):
         return self.id == other.id
 
     def __ne__(self, other):
         return self.id != other.id
 
-    def file_modified(self):
-        if not os.path.exists(self.target):
-            return True
-        source_last_mod = datetime.datetime.fromtimestamp(
-            os.path.getmtime(self.source))
-        if source_last_mod > self.last_modified:
-            return True
-        return False
+
+class ParseEntry(ParseEntryMixin, Model):
+    __tablename__ = "parse"
+    id = Column(Integer, primary_key=True)
+    source = Column(String(512))
+    lang = Column(String(10), nullable=True)
+    last_modified = Column(DateTime)
+    checksum = Column(String(64))
+    size = Column(Integer, nullable=True)
+    parser = Column(String(40))
+    dependencies = Column(Text)
+    expressions = Column(Text)
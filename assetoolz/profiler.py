@@ -0,0 +1,111 @@
+from contextlib import contextmanager
+import io
+import json
+import threading
+import time
+
+if hasattr(time, 'thread_time'):
+    cpu_time = time.thread_time
+elif hasattr(time, 'process_time'):
+    cpu_time = time.process_time
+else:
+    cpu_time = time.clock
+
+
+class Profiler(object):
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Profiler, cls).__new__(cls)
+            cls.instance._enabled = False
+            cls.instance._started = time.time()
+            cls.instance._records = []
+        return cls.instance
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def enable(self):
+        self._enabled = True
+        self._started = time.time()
+        self._records = []
+
+    @contextmanager
+    def measure(self, step, name=None):
+        # name may be any object, it is turned into a string only when
+        # profiling is enabled
+        if not self._enabled:
+            yield
+            return
+        started = time.time()
+        cpu_started = cpu_time()
+        try:
+            yield
+        finally:
+            self._records.append((
+                step,
+                None if name is None else str(name),
+                started - self._started,
+                time.time() - started,
+                cpu_time() - cpu_started,
+                threading.current_thread().ident))
+
+    def get_totals(self, key, records=None):
+        if records is None:
+            records = self._records
+        totals = {}
+        for record in records:
+            total = totals.setdefault(key(record), [0.0, 0.0, 0])
+            total[0] += record[3]
+            total[1] += record[4]
+            total[2] += 1
+        return sorted(totals.items(), key=lambda item: -item[1][0])
+
+    def report(self, top=10):
+        line = '  {name:<48} {wall:9.3f} {cpu:9.3f} {count:6d}'
+        print('Profile (wall s, cpu s, calls):')
+        print(' Steps:')
+        for step, total in self.get_totals(lambda record: record[0]):
+            print(line.format(name=step, wall=total[0], cpu=total[1],
+                              count=total[2]))
+
+        print(' Slowest assets:')
+        compiled = [record for record in self._records
+                    if record[0] == 'compile']
+        for name, total in self.get_totals(lambda record: record[1],
+                                           compiled)[:top]:
+            print(line.format(name=name, wall=total[0], cpu=total[1],
+                              count=total[2]))
+
+        print(' Slowest steps:')
+        records = [record for record in self._records
+                   if record[1] is not None]
+        for record in sorted(records, key=lambda record: -record[3])[:top]:
+            print(line.format(name='{0} {1}'.format(record[0], record[1]),
+                              wall=record[3], cpu=record[4], count=1))
+
+    def save(self, path, output_format='json'):
+        if output_format == 'trace':
+            # chrome://tracing / Perfetto format
+            data = {'traceEvents': [{
+                'name': record[0] if record[1] is None else
+                '{0} {1}'.format(record[0], record[1]),
+                'cat': record[0],
+                'ph': 'X',
+                'ts': int(record[2] * 1000000),
+                'dur': int(record[3] * 1000000),
+                'pid': 1,
+                'tid': record[5],
+                'args': {'cpu': record[4]}
+            } for record in self._records]}
+        else:
+            data = {'records': [{
+                'step': record[0],
+                'name': record[1],
+                'start': record[2],
+                'wall': record[3],
+                'cpu': record[4]
+            } for record in self._records]}
+        with io.open(path, 'wb') as f:
+            f.write(json.dumps(data, indent=2, sort_keys=True,
+                               separators=(',', ': ')).encode('utf-8'))
@@ -0,0 +1,98 @@
+from collections import deque
+import threading
+import traceback
+from .profiler import Profiler
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class BuildScheduler(object):
+    # An asset is handed to a worker thread as soon as all of its
+    # dependencies are finished. Cache lookups and writes stay on the
+    # calling thread, workers only produce target files.
+    def __init__(self, assets, jobs, force=False):
+        self._assets = assets
+        self._jobs = jobs
+        self._force = force
+
+        keys = set((asset._path, asset._lang) for asset in assets)
+        self._pending = {}
+        self._dependents = {}
+        for asset in assets:
+            deps = set((dep._path, dep._lang) for dep in asset._dependencies)
+            deps.intersection_update(keys)
+            self._pending[(asset._path, asset._lang)] = len(deps)
+            for dep in deps:
+                self._dependents.setdefault(dep, []).append(asset)
+
+    def run(self):
+        tasks = queue.Queue()
+        results = queue.Queue()
+        workers = []
+        for x in range(0, self._jobs):
+            worker = threading.Thread(target=self._work,
+                                      args=(tasks, results))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        ready = deque([asset for asset in self._assets
+                       if self._pending[(asset._path, asset._lang)] == 0])
+        in_flight = 0
+        error = None
+        try:
+            while len(ready) > 0 or in_flight > 0:
+                while len(ready) > 0 and error is None:
+                    asset = ready.popleft()
+                    outdated, cache_entry = asset.is_outdated(self._force)
+                    if outdated:
+                        tasks.put((asset, cache_entry, self._force))
+                        in_flight += 1
+                    else:
+                        asset.report_cached()
+                        self._finish(asset, ready)
+
+                if in_flight == 0:
+                    break
+
+                asset, cache_entry, result, exc = results.get()
+                in_flight -= 1
+                if exc is not None:
+                    if error is None:
+                        error = exc
+                    continue
+                target_path, changed = result
+                asset.store(cache_entry, target_path, changed)
+                self._finish(asset, ready)
+        finally:
+            for worker in workers:
+                tasks.put(None)
+            for worker in workers:
+                worker.join()
+
+        if error is not None:
+            raise error
+
+    def _finish(self, asset, ready):
+        for dependent in self._dependents.get((asset._path, asset._lang), []):
+            key = (dependent._path, dependent._lang)
+            self._pending[key] -= 1
+            if self._pending[key] == 0:
+                ready.append(dependent)
+
+    @staticmethod
+    def _work(tasks, results):
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            asset, cache_entry, force = task
+            try:
+                with Profiler().measure('compile', asset):
+                    result = asset.build(cache_entry, force)
+                results.put((asset, cache_entry, result, None))
+            except Exception as e:
+                traceback.print_exc()
+                results.put((asset, cache_entry, None, e))
@@ -0,0 +1,158 @@
+import datetime
+import sqlite3
+from .db import upgrade_schema
+from .models import CacheEntryMixin, ParseEntryMixin
+
+# the same tables SQLAlchemy creates for CacheEntry and ParseEntry, so
+# either backend can open a cache.db written by the other
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS cache (
+        id INTEGER NOT NULL,
+        source VARCHAR(512),
+        target VARCHAR(512),
+        lang VARCHAR(10),
+        last_modified DATETIME,
+        checksum VARCHAR(64),
+        size INTEGER,
+        built FLOAT,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS parse (
+        id INTEGER NOT NULL,
+        source VARCHAR(512),
+        lang VARCHAR(10),
+        last_modified DATETIME,
+        checksum VARCHAR(64),
+        size INTEGER,
+        parser VARCHAR(40),
+        dependencies TEXT,
+        expressions TEXT,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_cache_source_lang ON cache (source, lang)",
+    "CREATE INDEX IF NOT EXISTS ix_parse_source_lang ON parse (source, lang)"
+]
+
+
+def format_datetime(value):
+    # the format SQLAlchemy stores DATETIME columns in on SQLite
+    if value is None:
+        return None
+    return '{0:%Y-%m-%d %H:%M:%S.%f}'.format(value)
+
+
+def parse_datetime(value):
+    if value is None:
+        return None
+    microsecond = 0
+    if len(value) > 20:
+        microsecond = int(value[20:26].ljust(6, '0'))
+    return datetime.datetime(int(value[0:4]), int(value[5:7]),
+                             int(value[8:10]), int(value[11:13]),
+                             int(value[14:16]), int(value[17:19]),
+                             microsecond)
+
+
+class CacheRecord(CacheEntryMixin):
+    table = 'cache'
+    columns = ('id', 'source', 'target', 'lang', 'last_modified', 'checksum',
+               'size', 'built')
+    id = None
+    size = None
+    built = None
+
+
+class ParseRecord(ParseEntryMixin):
+    table = 'parse'
+    columns = ('id', 'source', 'lang', 'last_modified', 'checksum', 'size',
+               'parser', 'dependencies', 'expressions')
+    id = None
+    last_modified = None
+    checksum = None
+    size = None
+    parser = None
+    dependencies = None
+    expressions = None
+
+
+class SqliteStore(object):
+    # cache entries are plain objects, each table is read with a single
+    # query and changes are written with executemany on commit
+    cache_entry_class = CacheRecord
+    parse_entry_class = ParseRecord
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL").fetchall()
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+        upgrade_schema(self._connection)
+        self._connection.commit()
+        self._next_ids = {}
+        self._saved = {}
+        self._deleted = {}
+
+    def load(self, entry_class):
+        columns = entry_class.columns
+        rows = self._connection.execute('SELECT {columns} FROM {table}'.format(
+            columns=', '.join(columns), table=entry_class.table))
+        records = []
+        for row in rows:
+            record = entry_class.__new__(entry_class)
+            record.__dict__.update(zip(columns, row))
+            record.last_modified = parse_datetime(record.last_modified)
+            records.append(record)
+        return records
+
+    def add(self, entry):
+        # new entries get their id right away, rows are replaced by id
+        if entry.id is None:
+            entry.id = self._get_next_id(entry.table)
+        self._saved.setdefault(entry.table, {})[entry.id] = entry
+
+    def delete(self, entry):
+        if entry.id is None:
+            return
+        self._saved.get(entry.table, {}).pop(entry.id, None)
+        self._deleted.setdefault(entry.table, []).append((entry.id,))
+
+    def commit(self):
+        for table, ids in self._deleted.items():
+            self._connection.executemany(
+                'DELETE FROM {table} WHERE id = ?'.format(table=table), ids)
+        for table, entries in self._saved.items():
+            if len(entries) == 0:
+                continue
+            columns = next(iter(entries.values())).columns
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO {table} ({columns}) '
+                'VALUES ({values})'.format(
+                    table=table, columns=', '.join(columns),
+                    values=', '.join(['?'] * len(columns))),
+                [self._get_row(entry) for entry in entries.values()])
+        self._connection.commit()
+        self._saved = {}
+        self._deleted = {}
+
+    def close(self):
+        self._connection.close()
+
+    def _get_next_id(self, table):
+        next_id = self._next_ids.get(table)
+        if next_id is None:
+            row = self._connection.execute(
+                'SELECT MAX(id) FROM {table}'.format(table=table)).fetchone()
+            next_id = (row[0] or 0) + 1
+        self._next_ids[table] = next_id + 1
+        return next_id
+
+    @staticmethod
+    def _get_row(entry):
+        row = []
+        for column in entry.columns:
+            value = getattr(entry, column)
+            if column == 'last_modified':
+                value = format_datetime(value)
+            row.append(value)
+        return row
@@ -0,0 +1,22 @@
+import subprocess
+
+
+class ToolError(Exception):
+    pass
+
+
+def run_tool(command, data=None):
+    # data is fed to the tool's stdin, its stdout is returned as text
+    proc = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    out, err = proc.communicate(
+        data.encode('utf-8') if data is not None else None)
+    if proc.returncode != 0:
+        raise ToolError('{tool} exited with code {code:d}: {error}'.format(
+            tool=command[0], code=proc.returncode,
+            error=err.decode('utf-8', 'replace').strip()))
+    return out.decode('utf-8')
@@ -1,34 +1,121 @@
 from hashlib import sha256
+import errno
 import io
+import mmap
 import os
+import threading
 import urlparse
+try:
+    from hashlib import blake2b
+except ImportError:
+    try:
+        from pyblake2 import blake2b
+    except ImportError:
+        blake2b = None
+
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+# 36 ** 12 still fits into a machine word
+DIGITS_PER_CHUNK = 12
+CHUNK_BASE = len(ALPHABET) ** DIGITS_PER_CHUNK
+READ_SIZE = 1024 * 1024
 
 
 def shorten_digest(hexdigest):
-    alphabet = list("0123456789abcdefghijklmnopqrstuvwxyz")
-    alpha_len = len(alphabet)
+    alpha_len = len(ALPHABET)
 
     unique_id = int(hexdigest, 16)
-    output = ""
+    output = []
     while unique_id:
-        unique_id, digit = divmod(unique_id, alpha_len)
-        output += alphabet[digit]
-    return output
+        unique_id, chunk = divmod(unique_id, CHUNK_BASE)
+        for x in range(0, DIGITS_PER_CHUNK):
+            if not unique_id and not chunk:
+                break
+            chunk, digit = divmod(chunk, alpha_len)
+            output.append(ALPHABET[digit])
+    return ''.join(output)
+
+
+def update_hash(hash, path):
+    with io.open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= READ_SIZE:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                hash.update(data)
+            finally:
+                data.close()
+        else:
+            for chunk in iter(lambda: f.read(READ_SIZE), b''):
+                hash.update(chunk)
+
+
+def get_stat_key(path):
+    stat = os.stat(path)
+    return (path, stat.st_size, getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+
+class FileHashes(object):
+    # file digests memoized by path, size and mtime, so a file hashed for
+    # its fingerprint is not read again for its checksum
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(FileHashes, cls).__new__(cls)
+            cls.instance._memo = {}
+            cls.instance._algorithm = 'sha256'
+            cls.instance._lock = threading.Lock()
+        return cls.instance
+
+    def set_algorithm(self, algorithm):
+        if algorithm not in ('sha256', 'blake2b'):
+            raise ValueError('Unknown checksum algorithm {0}'.format(
+                algorithm))
+        if algorithm == 'blake2b' and blake2b is None:
+            raise ValueError('blake2b is not available, install pyblake2 '
+                             '(pip install assetoolz[blake2]) or use sha256')
+        with self._lock:
+            if algorithm != self._algorithm:
+                self._memo = {}
+            self._algorithm = algorithm
+
+    def new_hash(self):
+        if self._algorithm == 'blake2b':
+            return blake2b(digest_size=16)
+        return sha256()
+
+    def clear(self):
+        with self._lock:
+            self._memo = {}
+
+    def get(self, path):
+        key = get_stat_key(path)
+        digest = self._memo.get(key)
+        if digest is None:
+            hash = self.new_hash()
+            update_hash(hash, path)
+            digest = shorten_digest(hash.hexdigest())
+            with self._lock:
+                self._memo[key] = digest
+        return digest
+
+    def remember(self, path, digest):
+        key = get_stat_key(path)
+        with self._lock:
+            self._memo[key] = digest
 
 
 def get_file_hash(path, unique=False):
-    hash = sha256()
+    digest = FileHashes().get(path)
     if unique:
-        hash.update(os.urandom(32))
-    with io.open(path, 'rb') as f:
-        for chunk in iter(lambda: f.read(io.DEFAULT_BUFFER_SIZE), b''):
-            hash.update(chunk)
-    return shorten_digest(hash.hexdigest())
+        return get_data_hash(os.urandom(32) + digest.encode('ascii'),
+                             short=True)
+    return digest
 
 
-def get_data_hash(data):
+def get_data_hash(data, short=False):
     hash = sha256()
     hash.update(data)
+    if short:
+        return shorten_digest(hash.hexdigest())
     return hash.hexdigest()
 
 
@@ -39,9 +126,18 @@ def load_file(path):
     return data
 
 
+def make_dirs(path):
+    # worker threads may create the same directory concurrently
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
 def save_file(path, data):
     if not os.path.exists(os.path.dirname(path)):
-        os.makedirs(os.path.dirname(path))
+        make_dirs(os.path.dirname(path))
     with io.open(path, 'w', encoding='utf-8') as f:
         f.write(data)
 
@@ -0,0 +1,96 @@
+import time
+import traceback
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+def take_snapshot(scan_sources, settings):
+    return dict((path, (stat.st_mtime, stat.st_size))
+                for path, stat in scan_sources(settings))
+
+
+class PollingWaiter(object):
+    def __init__(self, source_dirs, interval):
+        self._interval = interval
+
+    def wait(self):
+        time.sleep(self._interval)
+
+
+class InotifyWaiter(object):
+    # inotify is only used to sleep until something happens, the snapshot
+    # comparison still decides what has changed
+    def __init__(self, source_dirs, interval):
+        self._interval = interval
+        self._manager = pyinotify.WatchManager()
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_CREATE |\
+            pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM |\
+            pyinotify.IN_MOVED_TO | pyinotify.IN_ATTRIB
+        for source_dir in source_dirs:
+            self._manager.add_watch(source_dir, mask, rec=True, auto_add=True)
+        self._notifier = pyinotify.Notifier(
+            self._manager, default_proc_fun=pyinotify.ProcessEvent())
+
+    def wait(self):
+        if self._notifier.check_events(timeout=None):
+            # let editors finish writing before taking a snapshot
+            time.sleep(min(self._interval, 0.1))
+            self._notifier.read_events()
+            self._notifier.process_events()
+
+
+class Watcher(object):
+    def __init__(self, settings, scan_sources, load_assets):
+        self._settings = settings
+        self._scan_sources = scan_sources
+        self._load_assets = load_assets
+        self._assets = None
+        self._snapshot = {}
+        source_dirs = settings.source_dirs
+        if pyinotify is not None:
+            self._waiter = InotifyWaiter(source_dirs, settings.watch_interval)
+        else:
+            self._waiter = PollingWaiter(source_dirs, settings.watch_interval)
+
+    def reload(self):
+        self._assets = None
+        self._snapshot = take_snapshot(self._scan_sources, self._settings)
+        assets = self._load_assets(self._settings)
+        assets.build()
+        self._assets = assets
+
+    def update(self):
+        snapshot = take_snapshot(self._scan_sources, self._settings)
+        if snapshot == self._snapshot:
+            return
+        previous = self._snapshot
+        self._snapshot = snapshot
+
+        if self._assets is None or set(snapshot) != set(previous):
+            # files were added or removed, the asset list has to be rebuilt
+            self.reload()
+            return
+
+        changed = set([path for path, stat in snapshot.items()
+                       if previous[path] != stat])
+        self._assets.rebuild(changed)
+
+    def run(self):
+        try:
+            self.reload()
+        except Exception:
+            traceback.print_exc()
+        print('Watching for changes...')
+        try:
+            while True:
+                self._waiter.wait()
+                try:
+                    self.update()
+                except Exception:
+                    # start over with a full reload on the next change
+                    traceback.print_exc()
+                    self._assets = None
+        except KeyboardInterrupt:
+            print('Stopped watching.')
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# Builds a synthetic asset tree and times cold, warm and single-file-change
+# builds. Minifiers and the CoffeeScript compiler are replaced by stubs, so
+# the benchmark runs offline and measures assetoolz itself.
+#
+#   python benchmarks/bench.py --pages 200 --output new.json
+#   python benchmarks/bench.py --pages 200 --compare old.json
+from __future__ import print_function
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STUB_JAVA = '''#!{python}
+# yuicompressor/htmlcompressor stub: copies input to output
+import os, re, sys
+args = sys.argv[1:]
+output = None
+inputs = []
+index = 0
+while index < len(args):
+    arg = args[index]
+    if arg in ('-jar', '--type', '--mask', '-o'):
+        if arg == '-o':
+            output = args[index + 1]
+        index += 2
+        continue
+    if not arg.startswith('-'):
+        inputs.append(arg)
+    index += 1
+if not inputs:
+    sys.stdout.write(sys.stdin.read())
+for source in inputs:
+    with open(source, 'rb') as f:
+        data = f.read()
+    if output is None:
+        sys.stdout.write(data.decode('utf-8'))
+        continue
+    if '$:' in output:
+        pattern, replacement = output.split(':', 1)
+        target = re.sub(pattern, replacement, source)
+    elif output.endswith(os.sep):
+        target = os.path.join(output, os.path.basename(source))
+    else:
+        target = output
+    with open(target, 'wb') as f:
+        f.write(data)
+'''
+
+STUB_COFFEE = '''#!{python}
+# coffee stub: "coffee -c [-o dir] files" writes .js files, "-p" prints them
+import os, sys
+args = sys.argv[1:]
+output = None
+if '-o' in args:
+    index = args.index('-o')
+    output = args[index + 1]
+    del args[index:index + 2]
+sources = [arg for arg in args if not arg.startswith('-')]
+if not sources:
+    sys.stdout.write(sys.stdin.read())
+for source in sources:
+    with open(source, 'rb') as f:
+        data = f.read()
+    if '-p' in args:
+        sys.stdout.write(data.decode('utf-8'))
+    else:
+        name = os.path.basename(source)[:-len('.coffee')] + '.js'
+        with open(os.path.join(output or os.path.dirname(source), name),
+                  'wb') as f:
+            f.write(data)
+'''
+
+
+def write(path, data):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(data)
+
+
+def write_binary(path, data):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with io.open(path, 'wb') as f:
+        f.write(data)
+
+
+def make_stub(path, template):
+    write(path, template.format(python=sys.executable))
+    os.chmod(path, 0o755)
+
+
+def generate_tree(root, params):
+    rnd = random.Random(params['seed'])
+    src = os.path.join(root, 'src')
+    out = os.path.join(root, 'out')
+    languages = ['l{0:d}'.format(x) for x in range(params['languages'])]
+
+    words = ['alpha', 'beta', 'gamma', 'delta', 'omega', 'sigma', 'kappa']
+
+    def text(count):
+        return ' '.join(rnd.choice(words) for x in range(count))
+
+    for lang in languages:
+        keys = '\n'.join('  key{0:d}: "{1} {2}"'.format(x, lang, text(4))
+                         for x in range(params['keys']))
+        write(os.path.join(root, 'i18n', lang + '.yml'),
+              u'site:\n{0}\n'.format(keys))
+
+    for x in range(params['images']):
+        write_binary(os.path.join(src, 'img', 'image{0:d}.png'.format(x)),
+                     bytearray(rnd.getrandbits(8) for y in range(4096)))
+    for x in range(params['fonts']):
+        write_binary(os.path.join(src, 'fonts', 'font{0:d}.woff'.format(x)),
+                     bytearray(rnd.getrandbits(8) for y in range(8192)))
+
+    for x in range(params['stylesheets']):
+        body = u'\n'.join(
+            u'.c{0:d} {{ background: url(/*= image_url image{1:d}.png */); }}'
+            .format(y, rnd.randrange(params['images']))
+            for y in range(20))
+        write(os.path.join(src, 'css', '_part{0:d}.css'.format(x)), body)
+        write(os.path.join(src, 'css', 'style{0:d}.css'.format(x)),
+              u'/*= include part{0:d}.css */\n@font-face {{ src: '
+              u'url(/*= font_url font{1:d}.woff */); }}\n{2}\n'.format(
+                  x, rnd.randrange(params['fonts']), u'p { margin: 0; }\n' * 50))
+
+    for x in range(params['scripts']):
+        write(os.path.join(src, 'js', '_lib{0:d}.js'.format(x)),
+              u'var lib{0:d} = /*= config site:name|json */;\n{1}'.format(
+                  x, u'function f() { return 1; }\n' * 50))
+        extension = '.coffee' if x % 4 == 0 else '.js'
+        write(os.path.join(src, 'js', 'app{0:d}{1}'.format(x, extension)),
+              u'/*= include lib{0:d}.js */\n{1}'.format(
+                  x, u'x = 1\n' * 50))
+    for x in range(params['vendor']):
+        write(os.path.join(src, 'js', 'vendor{0:d}.js'.format(x)),
+              u'var vendor = function() { return 1; };\n' * 200)
+
+    for x in range(params['includes']):
+        keys = u''.join(u'<span>[%- site:key{0:d} %]</span>\n'.format(
+            rnd.randrange(params['keys'])) for y in range(5))
+        write(os.path.join(src, 'html', '_partial{0:d}.html'.format(x)),
+              u'<div><img src="[%= image_url image{0:d}.png %]">\n{1}</div>\n'
+              .format(rnd.randrange(params['images']), keys))
+
+    for x in range(params['pages']):
+        parts = []
+        parts.append(u'<link href="[%= stylesheet_url style{0:d}.css %]">\n'
+                     .format(rnd.randrange(params['stylesheets'])))
+        script = rnd.randrange(params['scripts'])
+        parts.append(u'<script src="[%= script_url app{0:d}{1} %]"></script>\n'
+                     .format(script, '.coffee' if script % 4 == 0 else '.js'))
+        for y in range(params['page_includes']):
+            parts.append(u'[%= include partial{0:d} %]\n'.format(
+                rnd.randrange(params['includes'])))
+        for y in range(params['page_keys']):
+            parts.append(u'<p>[%- site:key{0:d} %] {1}</p>\n'.format(
+                rnd.randrange(params['keys']), text(8)))
+        write(os.path.join(src, 'html', 'page{0:d}.html'.format(x)),
+              u'<html><body>\n{0}</body></html>\n'.format(u''.join(parts)))
+
+    bin_dir = os.path.join(root, 'bin')
+    make_stub(os.path.join(bin_dir, 'java'), STUB_JAVA)
+    make_stub(os.path.join(bin_dir, 'coffee'), STUB_COFFEE)
+
+    config = {
+        'html': {'source': os.path.join(src, 'html'),
+                 'target': os.path.join(out, 'html'),
+                 'languages': languages},
+        'images': {'source': os.path.join(src, 'img'),
+                   'target': os.path.join(out, 'cdn', 'img')},
+        'fonts': {'source': os.path.join(src, 'fonts'),
+                  'target': os.path.join(out, 'cdn', 'fonts')},
+        'scripts': {'source': os.path.join(src, 'js'),
+                    'target': os.path.join(out, 'cdn', 'js')},
+        'stylesheets': {'source': os.path.join(src, 'css'),
+                        'target': os.path.join(out, 'cdn', 'css')},
+        'cdn': {'path': os.path.join(out, 'cdn'),
+                'url': 'http://cdn.example.com/'},
+        'minify': params['minify'],
+        'yuicompressor_file': os.path.join(bin_dir, 'yuicompressor.jar'),
+        'htmlcompressor_file': os.path.join(bin_dir, 'htmlcompressor.jar'),
+        'coffee_bin': os.path.join(bin_dir, 'coffee'),
+        'config': {'site': {'name': 'Benchmark'}},
+        'i18n': dict((lang, os.path.join(root, 'i18n', lang + '.yml'))
+                     for lang in languages),
+        'cache': os.path.join(root, 'cache'),
+        'resource': {'base_url': 'http://res.example.com', 'resources': {}}
+    }
+    config.update(params['settings'])
+    config_path = os.path.join(root, 'config.yml')
+    # JSON is valid YAML
+    write(config_path, json.dumps(config, indent=2))
+    return config_path
+
+
+def clean_outputs(root):
+    for name in ('out', 'cache'):
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    os.makedirs(os.path.join(root, 'cache'))
+
+
+def get_returncode(status):
+    # the exit code, or minus the signal number like Popen.returncode
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def run_build(root, config_path, jobs):
+    env = dict(os.environ)
+    env['PATH'] = os.path.join(root, 'bin') + os.pathsep + env['PATH']
+    env['PYTHONPATH'] = PACKAGE_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    command = [sys.executable, '-W', 'ignore', '-c',
+               'import sys; import assetoolz; sys.argv[0] = "assetoolz"; '
+               'assetoolz.main()', config_path, '-j', str(jobs)]
+    started = time.time()
+    with open(os.devnull, 'w') as devnull:
+        proc = subprocess.Popen(command, env=env, stdout=devnull)
+        # wait4 reports the peak RSS of this build alone
+        pid, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = get_returncode(status)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command)
+    # ru_maxrss is in kilobytes on Linux
+    return time.time() - started, usage.ru_maxrss
+
+
+def touch_single_file(root, iteration):
+    # a partial included by many pages, the realistic worst case
+    path = os.path.join(root, 'src', 'html', '_partial0.html')
+    with io.open(path, 'a', encoding='utf-8') as f:
+        f.write(u'<!-- change {0:d} -->\n'.format(iteration))
+
+
+def summarize(samples, rss):
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min': ordered[0],
+        'median': ordered[len(ordered) // 2],
+        'max': ordered[-1],
+        'max_rss': max(rss)
+    }
+
+
+def run_benchmark(params, repeat, jobs, keep=None):
+    root = keep or tempfile.mkdtemp(prefix='assetoolz-bench-')
+    try:
+        config_path = generate_tree(root, params)
+        samples = {'cold': [], 'warm': [], 'single_change': []}
+        rss = {'cold': [], 'warm': [], 'single_change': []}
+
+        def measure(name):
+            seconds, peak = run_build(root, config_path, jobs)
+            samples[name].append(seconds)
+            rss[name].append(peak)
+
+        for iteration in range(repeat):
+            clean_outputs(root)
+            measure('cold')
+            measure('warm')
+            touch_single_file(root, iteration)
+            measure('single_change')
+        return dict((name, summarize(samples[name], rss[name]))
+                    for name in samples)
+    finally:
+        if keep is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(results, baseline, threshold):
+    # returns False when a scenario got slower than the threshold allows
+    ok = True
+    print('{0:<16} {1:>10} {2:>10} {3:>8}'.format(
+        'scenario', 'baseline', 'current', 'change'))
+    for name in sorted(results):
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median']
+        after = results[name]['median']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = ' REGRESSION'
+            ok = False
+        print('{0:<16} {1:>10.3f} {2:>10.3f} {3:>+7.1%}{4}'.format(
+            name, before, after, change, flag))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='assetoolz benchmark')
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--includes', type=int, default=20)
+    parser.add_argument('--page-includes', type=int, default=5)
+    parser.add_argument('--keys', type=int, default=200)
+    parser.add_argument('--page-keys', type=int, default=50)
+    parser.add_argument('--languages', type=int, default=4)
+    parser.add_argument('--scripts', type=int, default=20)
+    parser.add_argument('--vendor', type=int, default=10)
+    parser.add_argument('--stylesheets', type=int, default=10)
+    parser.add_argument('--images', type=int, default=100)
+    parser.add_argument('--fonts', type=int, default=10)
+    parser.add_argument('--minify', action='store_true')
+    parser.add_argument('--setting', action='append', default=[],
+                        metavar='KEY=JSON',
+                        help='extra config entry, e.g. cache_batch_size=0')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--compare', type=str, default=None)
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed slowdown as a fraction, default 0.1')
+    parser.add_argument('--keep', type=str, default=None,
+                        help='generate the tree here and keep it')
+    args = parser.parse_args()
+
+    settings = {}
+    for item in args.setting:
+        key, value = item.split('=', 1)
+        settings[key] = json.loads(value)
+
+    params = {
+        'pages': args.pages,
+        'includes': args.includes,
+        'page_includes': args.page_includes,
+        'keys': args.keys,
+        'page_keys': args.page_keys,
+        'languages': args.languages,
+        'scripts': args.scripts,
+        'vendor': args.vendor,
+        'stylesheets': args.stylesheets,
+        'images': args.images,
+        'fonts': args.fonts,
+        'minify': args.minify,
+        'settings': settings,
+        'seed': args.seed
+    }
+    results = run_benchmark(params, args.repeat, args.jobs, args.keep)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'jobs': args.jobs,
+        'params': params,
+        'results': results
+    }
+    for name in ('cold', 'warm', 'single_change'):
+        print('{0:<16} median {1:8.3f}s  min {2:8.3f}s  max {3:8.3f}s  '
+              'rss {4:8.1f}MB'.format(
+                  name, results[name]['median'], results[name]['min'],
+                  results[name]['max'], results[name]['max_rss'] / 1024.0))
+
+    if args.output is not None:
+        with io.open(args.output, 'w', encoding='utf-8') as f:
+            f.write(u'{0}\n'.format(json.dumps(report, indent=2,
+                                               sort_keys=True,
+                                               separators=(',', ': '))))
+
+    if args.compare is not None:
+        with io.open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print('Warning: baseline was produced with different parameters')
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
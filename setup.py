@@ -1,6 +1,17 @@
 from setuptools import setup, find_packages
+import sys
 
 
+install_requires = [
+    'setuptools>=5.4',
+    'sqlalchemy>=0.9,<1.0',
+    'pyyaml>=3.11',
+    'simplejson>=3.6,<4.0'
+]
+if sys.version_info < (3, 5):
+    # os.scandir is available since Python 3.5
+    install_requires.append('scandir>=1.5')
+
 setup(
     name='assetoolz',
     version='0.0.7',
@@ -8,12 +19,11 @@ setup(
     author='Alexander Pyatkin',
     author_email='asp@thexyz.net',
     packages=find_packages('.'),
-    install_requires=[
-        'setuptools>=5.4',
-        'sqlalchemy>=0.9,<1.0',
-        'pyyaml>=3.11',
-        'simplejson>=3.6,<4.0'
-    ],
+    install_requires=install_requires,
+    extras_require={
+        # checksum_algorithm: blake2b, hashlib has it since Python 3.6
+        'blake2': ['pyblake2; python_version < "3.6"']
+    },
     url='https://github.com/aspyatkin/assetoolz',
     license='MIT',
     entry_points=dict(